@@ -1,7 +1,10 @@
-from flask import Flask, render_template, request, jsonify
+import time
+# Started before the other imports so the startup report includes Flask and OpenAI
+MODULE_LOAD_STARTED = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_file, has_request_context
 import json
 import re
-import time
 import random
 from datetime import datetime
 import os
@@ -9,40 +12,124 @@ import openai
 from dotenv import load_dotenv
 import threading
 import ipaddress
-
-# Network automation libraries
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from collections import deque, OrderedDict, Counter
+import tempfile
+import uuid
+import queue
+import gzip
+import shutil
+import heapq
+import hashlib
+import errno
 try:
-    import netmiko
-    from netmiko import ConnectHandler
-    NETMIKO_AVAILABLE = True
+    import fcntl
 except ImportError:
-    NETMIKO_AVAILABLE = False
-    print("Netmiko not available. SSH connections will be simulated.")
+    # Windows: shared files are not locked, so run a single worker there
+    fcntl = None
 
-try:
-    import napalm
+# Network automation libraries are imported lazily on first use. pyATS/Genie
+# alone takes several seconds and hundreds of MB to import, which every worker
+# would otherwise pay even in SIMULATION_MODE where none of them is used.
+def _load_netmiko():
+    from netmiko import ConnectHandler
+    return {"ConnectHandler": ConnectHandler}
+
+def _load_napalm():
     from napalm import get_network_driver
-    NAPALM_AVAILABLE = True
-except ImportError:
-    NAPALM_AVAILABLE = False
-    print("NAPALM not available. Device configuration will be simulated.")
+    return {"get_network_driver": get_network_driver}
 
-try:
+def _load_nornir():
     from nornir import InitNornir
     from nornir.plugins.tasks.networking import netmiko_send_command
-    from nornir.plugins.functions.text import print_result
-    NORNIR_AVAILABLE = True
-except ImportError:
-    NORNIR_AVAILABLE = False
-    print("Nornir not available. Parallel execution will be simulated.")
+    return {"InitNornir": InitNornir, "netmiko_send_command": netmiko_send_command}
 
-try:
+def _load_asyncssh():
+    import asyncssh
+    return {"asyncssh": asyncssh}
+
+def _load_numpy():
+    import numpy
+    return {"numpy": numpy}
+
+def _load_zstandard():
+    import zstandard
+    return {"zstandard": zstandard}
+
+def _load_pyats():
     from pyats.topology import loader
     from genie.conf import Genie
-    PYATS_AVAILABLE = True
-except ImportError:
-    PYATS_AVAILABLE = False
-    print("pyATS/Genie not available. Device testing will be simulated.")
+    return {"loader": loader, "Genie": Genie}
+
+# Driver registry: backend name -> loader and the message shown when it is missing
+NETWORK_BACKENDS = {
+    "netmiko": {"loader": _load_netmiko, "missing": "Netmiko not available. SSH connections will be simulated."},
+    "napalm": {"loader": _load_napalm, "missing": "NAPALM not available. Device configuration will be simulated."},
+    "nornir": {"loader": _load_nornir, "missing": "Nornir not available. Parallel execution will be simulated."},
+    "pyats": {"loader": _load_pyats, "missing": "pyATS/Genie not available. Device testing will be simulated."},
+    "asyncssh": {"loader": _load_asyncssh, "missing": "asyncssh not available. Async SSH devices will use Netmiko."},
+    "zstandard": {"loader": _load_zstandard, "missing": "zstandard not available. Config transfers will use gzip."},
+    "numpy": {"loader": _load_numpy, "missing": "NumPy not available. Every query will be translated by the model."}
+}
+
+# Loaded backends: name -> {"symbols": dict or None, "import_seconds": float}
+LOADED_BACKENDS = {}
+BACKENDS_LOCK = threading.Lock()
+
+def get_backend(name):
+    """Import a network automation backend on first use and return its symbols, or None if unavailable"""
+    if name in LOADED_BACKENDS:
+        return LOADED_BACKENDS[name]['symbols']
+    
+    with BACKENDS_LOCK:
+        if name not in LOADED_BACKENDS:
+            started = time.perf_counter()
+            try:
+                symbols = NETWORK_BACKENDS[name]['loader']()
+            except ImportError:
+                symbols = None
+                print(NETWORK_BACKENDS[name]['missing'])
+            LOADED_BACKENDS[name] = {
+                'symbols': symbols,
+                'import_seconds': time.perf_counter() - started
+            }
+    
+    return LOADED_BACKENDS[name]['symbols']
+
+def backend_available(name):
+    """Check whether a backend can be imported, loading it if needed"""
+    return get_backend(name) is not None
+
+def get_startup_report():
+    """Report module load time, per-backend import cost and process memory"""
+    backends = {}
+    for name in NETWORK_BACKENDS:
+        loaded = LOADED_BACKENDS.get(name)
+        backends[name] = {
+            "loaded": loaded is not None,
+            "available": loaded['symbols'] is not None if loaded else None,
+            "import_seconds": round(loaded['import_seconds'], 4) if loaded else None
+        }
+    
+    report = {
+        "module_load_seconds": round(MODULE_LOAD_SECONDS, 4) if MODULE_LOAD_SECONDS is not None else None,
+        "simulation_mode": os.getenv("SIMULATION_MODE", "true").lower() == "true",
+        "backends": backends
+    }
+    
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        report["max_rss_kb"] = None
+    
+    return report
+
+# Set once the module has finished loading
+MODULE_LOAD_SECONDS = None
 
 # Load environment variables from .env file
 load_dotenv()
@@ -52,6 +139,160 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 
 app = Flask(__name__)
 
+# Latency instrumentation. Histograms and counters are kept in process and
+# rendered in the Prometheus text format on /metrics.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_DEFINITIONS = {
+    "network_agent_stage_seconds": ("histogram", "Time spent in each processing stage"),
+    "network_agent_http_request_seconds": ("histogram", "HTTP request latency per endpoint"),
+    "network_agent_stage_errors_total": ("counter", "Stages that ended with an exception"),
+    "network_agent_openai_requests_total": ("counter", "OpenAI API calls by purpose and outcome"),
+    "network_agent_connection_cache_total": ("counter", "Device connection cache lookups by result"),
+    "network_agent_device_errors_total": ("counter", "Errors talking to network devices"),
+    "network_agent_errors_total": ("counter", "Errors by stage"),
+    "network_agent_audit_entries_total": ("counter", "Audit journal entries written"),
+    "network_agent_audit_dropped_total": ("counter", "Audit journal entries dropped because the queue was full"),
+    "network_agent_scheduler_wait_seconds": ("histogram", "Time device tasks spent queued by priority class"),
+    "network_agent_session_wait_seconds": ("histogram", "Time spent waiting for a free device session or asyncssh slot by backend"),
+    "network_agent_scheduler_tasks_total": ("counter", "Device tasks submitted to the scheduler by priority class"),
+    "network_agent_translation_index_total": ("counter", "Translation index lookups by result"),
+    "network_agent_compliance_evaluations_total": ("counter", "Device compliance checks by result (evaluated or cached)"),
+    "network_agent_circuit_transitions_total": ("counter", "Circuit breaker state changes by new state"),
+    "network_agent_circuit_rejections_total": ("counter", "Device calls rejected because the circuit breaker was open")
+}
+
+# (metric name, labels) -> {"buckets": [...], "sum": float, "count": int}
+HISTOGRAMS = {}
+# (metric name, labels) -> value
+COUNTERS = {}
+METRICS_LOCK = threading.Lock()
+
+# Emit spans and errors as one JSON object per line instead of plain prints
+STRUCTURED_LOGS = os.getenv("STRUCTURED_LOGS", "false").lower() == "true"
+
+def _metric_labels(labels):
+    """Turn label keyword arguments into a hashable, ordered key"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def observe_histogram(name, value, **labels):
+    """Record an observation in a latency histogram"""
+    key = (name, _metric_labels(labels))
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            HISTOGRAMS[key] = histogram
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+def increment_counter(name, amount=1, **labels):
+    """Increase a counter metric"""
+    key = (name, _metric_labels(labels))
+    with METRICS_LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + amount
+
+def emit_log(event, **fields):
+    """Write a structured JSON log line"""
+    record = {"ts": datetime.now().isoformat(), "event": event}
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+def log_error(stage, message, device_id=None):
+    """Report an error and count it, as JSON when structured logging is enabled"""
+    increment_counter("network_agent_errors_total", stage=stage)
+    if device_id:
+        increment_counter("network_agent_device_errors_total", device=device_id, stage=stage)
+    
+    if STRUCTURED_LOGS:
+        emit_log("error", stage=stage, device=device_id, message=message)
+    else:
+        print(message)
+
+@contextmanager
+def track_stage(stage, **fields):
+    """Time a processing stage and record it in the stage latency histogram"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        increment_counter("network_agent_stage_errors_total", stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        observe_histogram("network_agent_stage_seconds", duration, stage=stage)
+        if STRUCTURED_LOGS:
+            emit_log("span", stage=stage, duration_seconds=round(duration, 6), status=status, **fields)
+
+def create_chat_completion(purpose, **kwargs):
+    """Call the OpenAI chat API, recording latency and outcome per purpose"""
+    with track_stage(f"openai_{purpose}", model=kwargs.get("model")):
+        try:
+            response = openai.ChatCompletion.create(**kwargs)
+        except Exception:
+            increment_counter("network_agent_openai_requests_total", purpose=purpose, status="error")
+            raise
+    
+    increment_counter("network_agent_openai_requests_total", purpose=purpose, status="ok")
+    return response
+
+def _format_labels(labels, extra=()):
+    """Render labels in the Prometheus exposition format"""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    rendered = ",".join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs)
+    return "{" + rendered + "}"
+
+def render_prometheus_metrics():
+    """Render all histograms and counters in the Prometheus text format"""
+    with METRICS_LOCK:
+        histograms = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in HISTOGRAMS.items()}
+        counters = dict(COUNTERS)
+    
+    lines = []
+    for name, (metric_type, help_text) in METRIC_DEFINITIONS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        
+        if metric_type == "histogram":
+            for (metric_name, labels), histogram in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        else:
+            for (metric_name, labels), value in sorted(counters.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+    
+    return "\n".join(lines) + "\n"
+
+@app.before_request
+def start_request_timer():
+    request.environ['network_agent.started'] = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = request.environ.get('network_agent.started')
+    if started is not None:
+        observe_histogram(
+            "network_agent_http_request_seconds",
+            time.perf_counter() - started,
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
 # Simulated network devices for demo purposes
 NETWORK_DEVICES = {
     "router1": {
@@ -108,45 +349,377 @@ with open('agent_for_network_prompt.py', 'r') as file:
     AGENT_PROMPT = file.read()
 
 def get_device_connection(device_id):
-    """Get or create a connection to a network device"""
+    """Get or create a connection to a network device. Connection errors are logged by the caller"""
     device = NETWORK_DEVICES[device_id]
     
     # Check if we have a cached connection
     if device_id in DEVICE_CONNECTIONS and DEVICE_CONNECTIONS[device_id].get('connected', False):
+        increment_counter("network_agent_connection_cache_total", result="hit")
         return DEVICE_CONNECTIONS[device_id]['connection']
     
     # If we're in simulation mode or libraries aren't available, return None
-    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not NETMIKO_AVAILABLE:
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("netmiko"):
         return None
     
-    try:
-        # Create device connection parameters
-        device_params = {
-            'device_type': device['device_type'],
-            'ip': device['ip'],
-            'username': device['username'],
-            'password': device['password'],
-            'secret': device['secret'] if device['secret'] else None,
-            'timeout': 20,
-        }
+    # Create device connection parameters
+    device_params = {
+        'device_type': device['device_type'],
+        'ip': device['ip'],
+        'username': device['username'],
+        'password': device['password'],
+        'secret': device['secret'] if device['secret'] else None,
+        'timeout': 20,
+    }
+    
+    # Connect to the device
+    increment_counter("network_agent_connection_cache_total", result="miss")
+    drop_device_connection(device_id)
+    with track_stage("netmiko_connect", device=device_id), device_connect(device_id):
+        connection = get_backend("netmiko")['ConnectHandler'](**device_params)
+    
+    # Cache the connection
+    DEVICE_CONNECTIONS[device_id] = {
+        'connection': connection,
+        'connected': True,
+        'last_used': datetime.now(),
+        # Netmiko sessions are not thread-safe; one exchange at a time
+        'lock': threading.Lock()
+    }
+    
+    return connection
+
+@contextmanager
+def netmiko_session(device_id):
+    """Hold a device's cached Netmiko connection for one exchange, or yield None to simulate"""
+    connection = get_device_connection(device_id)
+    cached = DEVICE_CONNECTIONS.get(device_id)
+    if connection is None or cached is None:
+        yield connection
+        return
+    
+    started = time.perf_counter()
+    with cached['lock']:
+        observe_histogram("network_agent_session_wait_seconds", time.perf_counter() - started, backend="netmiko")
+        cached['last_used'] = datetime.now()
+        yield connection
+
+def drop_device_connection(device_id):
+    """Disconnect and forget a cached Netmiko session so the next call reconnects"""
+    cached = DEVICE_CONNECTIONS.pop(device_id, None)
+    if cached:
+        try:
+            cached['connection'].disconnect()
+        except Exception:
+            pass
+
+# Netmiko device types to NAPALM driver names; a device's "napalm_driver" overrides this
+NAPALM_DRIVERS = {
+    "cisco_ios": "ios",
+    "cisco_xe": "ios",
+    "cisco_nxos": "nxos_ssh",
+    "cisco_xr": "iosxr",
+    "arista_eos": "eos",
+    "juniper_junos": "junos",
+    "paloalto_panos": "panos",
+    "f5_tmsh": "f5"
+}
+
+def napalm_driver_name(device):
+    """NAPALM driver for a device"""
+    return device.get('napalm_driver') or NAPALM_DRIVERS.get(device['device_type'], device['device_type'])
+
+@contextmanager
+def napalm_session(device_id):
+    """Open a NAPALM session to a device; connection failures count against its circuit breaker"""
+    device = NETWORK_DEVICES[device_id]
+    driver = get_backend("napalm")['get_network_driver'](napalm_driver_name(device))
+    device_conn = driver(
+        hostname=device['ip'],
+        username=device['username'],
+        password=device['password'],
+        optional_args={'secret': device['secret'] if device['secret'] else ''}
+    )
+    with track_stage("napalm_session", device=device_id):
+        with device_connect(device_id):
+            device_conn.open()
+        try:
+            yield device_conn
+        finally:
+            device_conn.close()
+
+# Asyncio SSH backend. Netmiko needs a blocking thread per session, which caps
+# fan-out at the thread count. Device types listed in ASYNC_SSH_DEVICE_TYPES (or
+# devices with "ssh_backend": "asyncssh") are driven from a single event loop
+# instead, so one process can hold thousands of concurrent read sessions.
+ASYNC_SSH_DEVICE_TYPES = {t.strip() for t in os.getenv("ASYNC_SSH_DEVICE_TYPES", "").split(",") if t.strip()}
+# Caps both commands in flight and open sessions; the least recently used idle
+# session is closed to make room for a new one
+ASYNC_SSH_MAX_SESSIONS = int(os.getenv("ASYNC_SSH_MAX_SESSIONS", "1000"))
+
+# Per-platform CLI handling for the interactive shell
+ASYNC_SSH_PLATFORMS = {
+    "cisco_ios": {"disable_paging": "terminal length 0", "enter_config": "configure terminal", "exit_config": "end"},
+    "cisco_nxos": {"disable_paging": "terminal length 0", "enter_config": "configure terminal", "exit_config": "end"},
+    "arista_eos": {"disable_paging": "terminal length 0", "enter_config": "configure terminal", "exit_config": "end"},
+    "paloalto_panos": {"disable_paging": "set cli pager off", "enter_config": "configure", "exit_config": "exit"},
+    "f5_tmsh": {"disable_paging": "modify cli preference pager disabled display-threshold 0", "enter_config": None, "exit_config": None}
+}
+
+# Matches the trailing prompt of common network CLIs, e.g. "router1#", "admin@fw1>", "(config)#".
+# Only used until a session has learned its own prompt.
+PROMPT_PATTERN = re.compile(r'[\w.\-@()/:~\[\] ]{1,80}[>#$%]\s*$')
+
+ASYNC_SSH_LOOP = None
+ASYNC_SSH_LOOP_LOCK = threading.Lock()
+# device_id -> AsyncSSHSession in least recently used order, only touched from the event loop thread
+ASYNC_SSH_SESSIONS = OrderedDict()
+ASYNC_SSH_OPEN_LOCKS = {}
+ASYNC_SSH_SEMAPHORE = None
+
+class AsyncSSHSession:
+    """Interactive SSH shell on one device, driven from the asyncio event loop"""
+    
+    def __init__(self, device_id, device):
+        self.device_id = device_id
+        self.device = device
+        self.platform = ASYNC_SSH_PLATFORMS.get(device['device_type'], ASYNC_SSH_PLATFORMS["cisco_ios"])
+        self.connection = None
+        self.process = None
+        self.prompt = None
+        self.prompt_pattern = PROMPT_PATTERN
+        # One command at a time per channel
+        self.lock = asyncio.Lock()
+    
+    async def open(self, timeout=20):
+        """Connect, detect the prompt, enter enable mode if needed and disable paging"""
+        asyncssh = get_backend("asyncssh")['asyncssh']
+        self.connection = await asyncssh.connect(
+            self.device['ip'],
+            username=self.device['username'],
+            password=self.device['password'],
+            known_hosts=None,
+            connect_timeout=timeout
+        )
+        self.process = await self.connection.create_process(term_type='vt100', term_size=(511, 24))
         
-        # Connect to the device
-        connection = ConnectHandler(**device_params)
+        # Sync with the prompt
+        self.process.stdin.write('\n')
+        self._learn_prompt(await self._read_until_prompt(timeout))
         
-        # Cache the connection
-        DEVICE_CONNECTIONS[device_id] = {
-            'connection': connection,
-            'connected': True,
-            'last_used': datetime.now()
-        }
+        if self.prompt.endswith('>') and self.device.get('secret') and self.platform['enter_config'] == "configure terminal":
+            self.process.stdin.write('enable\n')
+            await self._read_until(re.compile(r'[Pp]assword:\s*$|' + self.prompt_pattern.pattern), timeout)
+            self.process.stdin.write(self.device['secret'] + '\n')
+            self._learn_prompt(await self._read_until_prompt(timeout))
         
-        return connection
-    except Exception as e:
-        print(f"Error connecting to {device_id}: {e}")
-        return None
+        if self.platform['disable_paging']:
+            await self.send_command(self.platform['disable_paging'], timeout)
+    
+    @staticmethod
+    def _last_line(output):
+        lines = output.strip().splitlines()
+        return lines[-1].strip() if lines else ''
+    
+    def _learn_prompt(self, output):
+        """Match later prompts on this device's hostname so command output that looks like a prompt is not cut short"""
+        self.prompt = self._last_line(output)
+        hostname = re.sub(r'\(config[^)]*\)$', '', self.prompt[:-1])
+        self.prompt_pattern = re.compile(re.escape(hostname) + r'(?:\(config[^)]*\))?[>#$%]\s*$')
+    
+    async def _read_until(self, pattern, timeout):
+        """Read from the shell until the buffered output matches pattern"""
+        buffer = ''
+        deadline = time.monotonic() + timeout
+        while not pattern.search(buffer):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for prompt on {self.device_id}")
+            chunk = await asyncio.wait_for(self.process.stdout.read(65536), remaining)
+            if not chunk:
+                raise ConnectionError(f"Session to {self.device_id} closed")
+            buffer += chunk.replace('\r', '')
+        return buffer
+    
+    async def _read_until_prompt(self, timeout):
+        return await self._read_until(self.prompt_pattern, timeout)
+    
+    async def send_command(self, command, timeout=60):
+        """Run a command and return its output without the echo and trailing prompt"""
+        self.process.stdin.write(command + '\n')
+        output = await self._read_until_prompt(timeout)
+        lines = output.splitlines()
+        if lines and lines[0].strip().endswith(command.strip()):
+            lines = lines[1:]
+        if lines and self.prompt_pattern.search(lines[-1]):
+            lines = lines[:-1]
+        return '\n'.join(lines)
+    
+    async def send_config_set(self, config_commands, timeout=60):
+        """Enter config mode, apply each line and return to the exec prompt"""
+        commands = [c for c in config_commands if c.strip()]
+        if self.platform['enter_config']:
+            commands = [self.platform['enter_config']] + commands + [self.platform['exit_config']]
+        
+        output = []
+        for command in commands:
+            output.append(command)
+            result = await self.send_command(command, timeout)
+            if result:
+                output.append(result)
+        return '\n'.join(output)
+    
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+        self.process = None
+
+def uses_async_ssh(device):
+    """Check whether a device should be driven by the asyncio SSH backend"""
+    return device.get('ssh_backend') == 'asyncssh' or device.get('device_type') in ASYNC_SSH_DEVICE_TYPES
+
+def get_async_ssh_loop():
+    """Start the event loop thread for the asyncio SSH backend on first use"""
+    global ASYNC_SSH_LOOP
+    
+    with ASYNC_SSH_LOOP_LOCK:
+        if ASYNC_SSH_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="asyncssh-loop", daemon=True).start()
+            ASYNC_SSH_LOOP = loop
+    
+    return ASYNC_SSH_LOOP
+
+def run_async_ssh(coroutine, timeout=None):
+    """Run a coroutine on the SSH event loop from a Flask thread and wait for the result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_async_ssh_loop()).result(timeout)
+
+def _evict_async_sessions():
+    """Close least recently used idle sessions until there is room for one more"""
+    while len(ASYNC_SSH_SESSIONS) >= ASYNC_SSH_MAX_SESSIONS:
+        idle = next((device_id for device_id, session in ASYNC_SSH_SESSIONS.items() if not session.lock.locked()), None)
+        if idle is None:
+            return
+        ASYNC_SSH_SESSIONS.pop(idle).close()
+
+async def _get_async_session(device_id):
+    """Get or open the cached asyncio SSH session for a device"""
+    session = ASYNC_SSH_SESSIONS.get(device_id)
+    if session and session.process:
+        increment_counter("network_agent_connection_cache_total", result="hit")
+        ASYNC_SSH_SESSIONS.move_to_end(device_id)
+        return session
+    
+    lock = ASYNC_SSH_OPEN_LOCKS.setdefault(device_id, asyncio.Lock())
+    async with lock:
+        session = ASYNC_SSH_SESSIONS.get(device_id)
+        if session and session.process:
+            return session
+        
+        increment_counter("network_agent_connection_cache_total", result="miss")
+        _evict_async_sessions()
+        session = AsyncSSHSession(device_id, NETWORK_DEVICES[device_id])
+        with track_stage("asyncssh_connect", device=device_id), device_connect(device_id):
+            await session.open()
+        ASYNC_SSH_SESSIONS[device_id] = session
+        return session
+
+async def async_execute_device_command(device_id, command):
+    """Execute a command over the asyncio SSH backend"""
+    return (await async_execute_device_commands(device_id, [command]))[0]
+
+async def async_execute_device_commands(device_id, commands):
+    """Execute commands in order over one asyncio SSH session, honouring the global session cap"""
+    global ASYNC_SSH_SEMAPHORE
+    if ASYNC_SSH_SEMAPHORE is None:
+        ASYNC_SSH_SEMAPHORE = asyncio.Semaphore(ASYNC_SSH_MAX_SESSIONS)
+    
+    started = time.perf_counter()
+    async with ASYNC_SSH_SEMAPHORE:
+        # Queued behind the session cap, then behind another command on the same channel
+        waited = time.perf_counter() - started
+        try:
+            session = await _get_async_session(device_id)
+            outputs = []
+            started = time.perf_counter()
+            async with session.lock:
+                observe_histogram("network_agent_session_wait_seconds", waited + time.perf_counter() - started, backend="asyncssh")
+                with track_stage("asyncssh_send_command", device=device_id, commands=len(commands)):
+                    for command in commands:
+                        if command.lower().startswith('configure '):
+                            outputs.append(await session.send_config_set(command.replace('configure ', '').split('\n')))
+                        else:
+                            outputs.append(await session.send_command(command))
+            return outputs
+        except Exception as e:
+            # Drop the session so the next call reconnects
+            session = ASYNC_SSH_SESSIONS.pop(device_id, None)
+            if session:
+                session.close()
+            log_error("asyncssh", f"Error executing command on {device_id}: {e}", device_id)
+            if isinstance(e, DeviceUnreachableError):
+                raise
+            return [f"Error executing command: {str(e)}"] * len(commands)
+
+async def _async_fleet_command(device_id, command):
+    """Run one fleet command behind the device's circuit breaker"""
+    try:
+        acquire_circuit(device_id)
+        output = await async_execute_device_command(device_id, command)
+    except DeviceUnreachableError as e:
+        # Open breaker, or a connection failure already counted by device_connect
+        return f"Error executing command: {str(e)}"
+    record_circuit_success(device_id)
+    return output
+
+async def _async_fleet_execute(device_ids, command):
+    outputs = await asyncio.gather(*(_async_fleet_command(device_id, command) for device_id in device_ids))
+    return dict(zip(device_ids, outputs))
+
+def execute_fleet_command(device_ids, command, priority="batch"):
+    """Run a read command on many devices concurrently and return {device_id: output}"""
+    simulation = os.getenv("SIMULATION_MODE", "true").lower() == "true"
+    async_ids = []
+    threaded_ids = []
+    for device_id in device_ids:
+        if not simulation and uses_async_ssh(NETWORK_DEVICES[device_id]) and backend_available("asyncssh"):
+            async_ids.append(device_id)
+        else:
+            threaded_ids.append(device_id)
+    
+    results = {}
+    with track_stage("fleet_execute", devices=len(device_ids)):
+        if threaded_ids:
+            futures = [submit_device_task(device_id, priority, execute_device_command, device_id, command) for device_id in threaded_ids]
+            results.update(zip(threaded_ids, (future.result() for future in futures)))
+        if async_ids:
+            results.update(run_async_ssh(_async_fleet_execute(async_ids, command)))
+    
+    return results
+
+def close_async_ssh_sessions():
+    """Close all asyncio SSH sessions"""
+    if ASYNC_SSH_LOOP is None:
+        return
+    
+    def close_all():
+        for session in ASYNC_SSH_SESSIONS.values():
+            session.close()
+        ASYNC_SSH_SESSIONS.clear()
+    
+    ASYNC_SSH_LOOP.call_soon_threadsafe(close_all)
 
 def execute_device_command(device_id, command, use_napalm=False):
     """Execute a command on a real network device"""
+    with track_stage("execute_device_command", device=device_id, napalm=use_napalm):
+        try:
+            with device_circuit(device_id):
+                return _execute_device_command(device_id, command, use_napalm)
+        except DeviceUnreachableError as e:
+            return f"Error executing command: {str(e)}"
+
+def _execute_device_command(device_id, command, use_napalm):
+    """Run a command through NAPALM, Netmiko or the simulator"""
     device = NETWORK_DEVICES[device_id]
     
     # If we're in simulation mode, use OpenAI to simulate the response
@@ -154,19 +727,17 @@ def execute_device_command(device_id, command, use_napalm=False):
         return simulate_command_execution(device_id, command)
     
     try:
-        if use_napalm and NAPALM_AVAILABLE:
+        if not use_napalm and uses_async_ssh(device) and backend_available("asyncssh"):
+            # Drive the session from the asyncio SSH event loop
+            return run_async_ssh(async_execute_device_command(device_id, command))
+        
+        elif use_napalm and backend_available("napalm"):
             # Use NAPALM for configuration management
-            driver = get_network_driver(device['device_type'].replace('_', ''))
-            with driver(
-                hostname=device['ip'],
-                username=device['username'],
-                password=device['password'],
-                optional_args={'secret': device['secret'] if device['secret'] else ''}
-            ) as device_conn:
+            with napalm_session(device_id) as device_conn:
                 
                 if command.lower().startswith('get '):
                     # NAPALM getter methods
-                    method = command.lower().replace('get ', '').replace(' ', '_')
+                    method = 'get_' + command.lower().replace('get ', '', 1).strip().replace(' ', '_')
                     if hasattr(device_conn, method):
                         result = getattr(device_conn, method)()
                         return json.dumps(result, indent=2)
@@ -189,34 +760,99 @@ def execute_device_command(device_id, command, use_napalm=False):
                     # Fall back to CLI command
                     return device_conn.cli([command])[command]
         
-        elif NETMIKO_AVAILABLE:
+        elif backend_available("netmiko"):
             # Use Netmiko for SSH connections
-            connection = get_device_connection(device_id)
-            if connection:
-                if command.lower().startswith('configure '):
-                    # Configuration mode
-                    config_commands = command.replace('configure ', '').split('\n')
-                    output = connection.send_config_set(config_commands)
-                    return output
-                else:
-                    # Regular command
-                    output = connection.send_command(command)
-                    return output
-            else:
-                return simulate_command_execution(device_id, command)
+            with netmiko_session(device_id) as connection:
+                if connection:
+                    if command.lower().startswith('configure '):
+                        # Configuration mode
+                        config_commands = command.replace('configure ', '').split('\n')
+                        with track_stage("netmiko_send_config_set", device=device_id):
+                            output = connection.send_config_set(config_commands)
+                        return output
+                    else:
+                        # Regular command
+                        with track_stage("netmiko_send_command", device=device_id):
+                            output = connection.send_command(command)
+                        return output
+            return simulate_command_execution(device_id, command)
         
         else:
             # Fall back to simulation
             return simulate_command_execution(device_id, command)
             
     except Exception as e:
-        print(f"Error executing command on {device_id}: {e}")
+        log_error("execute_device_command", f"Error executing command on {device_id}: {e}", device_id)
+        # The cached session may be dead; reconnecting is what tells a dead device from a failed command
+        drop_device_connection(device_id)
+        if isinstance(e, DeviceUnreachableError):
+            raise
         return f"Error executing command: {str(e)}"
 
+def execute_device_commands(device_id, commands):
+    """Execute several commands on one device over a single session and return their outputs in order"""
+    with track_stage("execute_device_commands", device=device_id, commands=len(commands)):
+        try:
+            with device_circuit(device_id):
+                return _execute_device_commands(device_id, commands)
+        except DeviceUnreachableError as e:
+            return [f"Error executing command: {str(e)}"] * len(commands)
+
+def _execute_device_commands(device_id, commands):
+    """Run a batch with NAPALM getters and CLI reads over one asyncio SSH or Netmiko session"""
+    device = NETWORK_DEVICES[device_id]
+    
+    # If we're in simulation mode, simulate each command
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true":
+        return [simulate_command_execution(device_id, command) for command in commands]
+    
+    # Configuration changes keep their single-command semantics
+    if any(command.lower().startswith(('configure ', 'config ')) for command in commands):
+        return [execute_device_command(device_id, command, command.lower().startswith(('get ', 'config '))) for command in commands]
+    
+    # Same backends as single commands: NAPALM for getters, one SSH session for CLI reads
+    getters = list(dict.fromkeys(c for c in commands if c.lower().startswith('get '))) if backend_available("napalm") else []
+    cli_commands = [c for c in commands if c not in getters]
+    outputs = {}
+    
+    try:
+        if getters:
+            with napalm_session(device_id) as device_conn:
+                for command in getters:
+                    method = 'get_' + command.lower().replace('get ', '', 1).strip().replace(' ', '_')
+                    if hasattr(device_conn, method):
+                        outputs[command] = json.dumps(getattr(device_conn, method)(), indent=2)
+                    else:
+                        outputs[command] = f"Method {method} not available in NAPALM for this device type"
+        
+        if cli_commands and uses_async_ssh(device) and backend_available("asyncssh"):
+            outputs.update(zip(cli_commands, run_async_ssh(async_execute_device_commands(device_id, cli_commands))))
+        elif cli_commands and backend_available("netmiko"):
+            # One Netmiko session for the whole batch
+            with netmiko_session(device_id) as connection:
+                if connection:
+                    with track_stage("netmiko_send_command", device=device_id, commands=len(cli_commands)):
+                        outputs.update((command, connection.send_command(command)) for command in cli_commands)
+                else:
+                    outputs.update((command, simulate_command_execution(device_id, command)) for command in cli_commands)
+        else:
+            # Fall back to simulation
+            outputs.update((command, simulate_command_execution(device_id, command)) for command in cli_commands)
+        
+        return [outputs[command] for command in commands]
+    
+    except Exception as e:
+        log_error("execute_device_commands", f"Error executing commands on {device_id}: {e}", device_id)
+        drop_device_connection(device_id)
+        if isinstance(e, DeviceUnreachableError):
+            raise
+        return [f"Error executing command: {str(e)}"] * len(commands)
+
 def detect_device_from_query(query):
     """Detect which device the query is referring to using OpenAI"""
     try:
-        response = openai.ChatCompletion.create(
+        response = create_chat_completion(
+            "detect_device",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are a network device identifier. Extract the device name or IP address from the query. Return ONLY the device ID from this list: router1, switch1, firewall1, loadbalancer1. If no specific device is mentioned, return 'router1'."},
@@ -232,7 +868,7 @@ def detect_device_from_query(query):
             return device_id
         return list(NETWORK_DEVICES.keys())[0]  # Default to first device
     except Exception as e:
-        print(f"Error in device detection: {e}")
+        log_error("detect_device", f"Error in device detection: {e}")
         # Fallback to simple detection
         for device_id, device in NETWORK_DEVICES.items():
             if device_id in query.lower() or device["ip"] in query:
@@ -251,7 +887,8 @@ def translate_to_device_commands(query, device):
         For NAPALM getters, prefix with 'get ' (e.g., 'get interfaces').
         """
         
-        response = openai.ChatCompletion.create(
+        response = create_chat_completion(
+            "translate_command",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -261,9 +898,11 @@ def translate_to_device_commands(query, device):
             temperature=0.2
         )
         
-        return response.choices[0].message.content.strip()
+        command = response.choices[0].message.content.strip()
+        record_translation(query, device, command)
+        return command
     except Exception as e:
-        print(f"Error in command translation: {e}")
+        log_error("translate_command", f"Error in command translation: {e}")
         # Fallback to simple translation
         if "show" in query.lower() and "interface" in query.lower():
             return "show interfaces"
@@ -349,7 +988,8 @@ def analyze_network_anomalies(device_data):
         If no anomalies are detected, return an empty array: []
         """
         
-        response = openai.ChatCompletion.create(
+        response = create_chat_completion(
+            "analyze_anomalies",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -362,7 +1002,7 @@ def analyze_network_anomalies(device_data):
         anomalies = json.loads(response.choices[0].message.content.strip())
         return anomalies
     except Exception as e:
-        print(f"Error in anomaly detection: {e}")
+        log_error("analyze_anomalies", f"Error in anomaly detection: {e}")
         # Fallback to simple anomaly detection
         return detect_anomalies()
 
@@ -380,7 +1020,8 @@ def simulate_command_execution(device_id, command):
         Only return the command output as it would appear on the device, nothing else.
         """
         
-        response = openai.ChatCompletion.create(
+        response = create_chat_completion(
+            "simulate_command",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -392,7 +1033,7 @@ def simulate_command_execution(device_id, command):
         
         return response.choices[0].message.content.strip()
     except Exception as e:
-        print(f"Error in command execution simulation: {e}")
+        log_error("simulate_command", f"Error in command execution simulation: {e}")
         # Fallback to simple simulation
         if "show" in command.lower() and "run" in command.lower():
             return f"Current configuration for {device['vendor']} {device['model']}:\n... configuration details would appear here ..."
@@ -416,28 +1057,42 @@ def detect_anomalies():
         anomalies = [random.choice(possible_anomalies)]
     return anomalies
 
-def process_natural_language(query):
+def process_natural_language(query, priority="interactive"):
     """Process natural language query using OpenAI and convert to network commands"""
-    # Detect which device the query is referring to
-    device_id = detect_device_from_query(query)
-    device = NETWORK_DEVICES[device_id]
-    
-    # Translate natural language to device commands
-    command = translate_to_device_commands(query, device)
-    
-    # Determine if we should use NAPALM for this command
-    use_napalm = command.lower().startswith('get ') or command.lower().startswith('config ')
-    
-    # Execute the command on the device (or simulate)
-    result = execute_device_command(device_id, command, use_napalm)
+    with track_stage("process_natural_language"):
+        # Detect which device the query is referring to
+        with track_stage("detect_device"):
+            device_id = detect_device_from_query(query)
+        device = NETWORK_DEVICES[device_id]
+        
+        # Translate natural language to device commands
+        with track_stage("translate_command", device=device_id):
+            # Reuse a confirmed translation of a similar query before asking the model
+            translation = lookup_translation(query, device)
+            command = translation["command"] if translation else translate_to_device_commands(query, device)
+        
+        # Determine if we should use NAPALM for this command
+        use_napalm = command.lower().startswith('get ') or command.lower().startswith('config ')
+        
+        # Execute the command on the device (or simulate)
+        result = run_device_task(device_id, priority, execute_device_command, device_id, command, use_napalm)
+        
+        # Page large outputs instead of returning them in one body
+        result, output_pages = paginate_large_output(device_id, command, result)
     
-    return {
+    response = {
         "device": device,
         "device_id": device_id,
         "interpreted_command": command,
         "result": result,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
+    if output_pages:
+        response["output"] = output_pages
+    if translation:
+        response["translation_match"] = translation
+    
+    return response
 
 def discover_network_devices(subnet):
     """Discover network devices in a subnet using NAPALM or Nornir"""
@@ -451,12 +1106,29 @@ def discover_network_devices(subnet):
         # Parse the subnet
         network = ipaddress.IPv4Network(subnet)
         
+        # Hosts recently found dead are skipped until their breaker allows a probe
+        managed_ips = {device['ip']: device_id for device_id, device in NETWORK_DEVICES.items()}
+        
+        def host_key(ip_str):
+            return managed_ips.get(ip_str, ip_str)
+        
+        def should_probe(ip_str):
+            try:
+                acquire_circuit(host_key(ip_str), DISCOVERY_FAILURE_THRESHOLD)
+                return True
+            except DeviceUnreachableError:
+                return False
+        
         # Use Nornir for parallel execution if available
-        if NORNIR_AVAILABLE:
+        if backend_available("nornir"):
+            nornir = get_backend("nornir")
+            
             # Create a temporary inventory
             hosts = {}
             for ip in network.hosts():
                 ip_str = str(ip)
+                if not should_probe(ip_str):
+                    continue
                 hosts[ip_str] = {
                     "hostname": ip_str,
                     "username": os.getenv("DISCOVERY_USERNAME", "admin"),
@@ -465,7 +1137,7 @@ def discover_network_devices(subnet):
                 }
             
             # Initialize Nornir
-            nr = InitNornir(
+            nr = nornir['InitNornir'](
                 inventory={
                     "plugin": "nornir.plugins.inventory.simple.SimpleInventory",
                     "options": {
@@ -476,10 +1148,16 @@ def discover_network_devices(subnet):
             )
             
             # Try to connect to each host
-            results = nr.run(task=netmiko_send_command, command_string="show version")
+            results = nr.run(task=nornir['netmiko_send_command'], command_string="show version")
             
             # Process results
             for host, result in results.items():
+                error = next((r.exception for r in result if r.exception), None) if result.failed else None
+                if error is not None and is_unreachable_error(error):
+                    record_circuit_failure(host_key(host), error)
+                else:
+                    record_circuit_success(host_key(host))
+                
                 if not result.failed:
                     # Parse the output to determine device type
                     output = result.result
@@ -509,16 +1187,19 @@ def discover_network_devices(subnet):
                     discovered_devices.append(device_info)
         
         # If Nornir isn't available or didn't find anything, try NAPALM
-        elif NAPALM_AVAILABLE and not discovered_devices:
+        elif backend_available("napalm") and not discovered_devices:
             # Try common device types with NAPALM
             device_types = ["ios", "eos", "junos", "nxos"]
             
             for ip in network.hosts():
                 ip_str = str(ip)
+                if not should_probe(ip_str):
+                    continue
                 
+                error = None
                 for device_type in device_types:
                     try:
-                        driver = get_network_driver(device_type)
+                        driver = get_backend("napalm")['get_network_driver'](device_type)
                         with driver(
                             hostname=ip_str,
                             username=os.getenv("DISCOVERY_USERNAME", "admin"),
@@ -536,144 +1217,2500 @@ def discover_network_devices(subnet):
                                 "reachable": True
                             })
                             break  # Found a working driver, move to next IP
-                    except Exception:
+                    except Exception as e:
+                        error = e
                         continue  # Try next driver
+                else:
+                    # No driver could connect; only a connection failure marks the host dead
+                    if error is not None and is_unreachable_error(error):
+                        record_circuit_failure(host_key(ip_str), error)
+                        continue
+                record_circuit_success(host_key(ip_str))
         
         return discovered_devices
     
     except Exception as e:
-        print(f"Error discovering devices: {e}")
+        log_error("discover_devices", f"Error discovering devices: {e}")
         return list(NETWORK_DEVICES.values())
 
-@app.route('/')
-def index():
-    return render_template('index.html', devices=NETWORK_DEVICES)
+# Network topology built from LLDP neighbor tables. Each device's reported links
+# are kept separately so a change on one device only rewrites that device's edges.
+TOPOLOGY_LOCK = threading.Lock()
+# device_id -> set of (local_port, neighbor, remote_port) reported by that device
+TOPOLOGY_REPORTED = {}
+# node -> {neighbor: set of (reporter, local_port, remote_port)}
+TOPOLOGY_ADJACENCY = {}
+TOPOLOGY_STATE = {"version": 0, "updated": {}, "cache": None, "cache_version": -1}
 
-@app.route('/api/devices')
-def get_devices():
-    return jsonify(NETWORK_DEVICES)
+# Links used for neighbor tables in simulation mode
+SIMULATED_LLDP_LINKS = [
+    ("router1", "GigabitEthernet0/0/1", "switch1", "Ethernet1"),
+    ("switch1", "Ethernet47", "loadbalancer1", "1.1"),
+    ("switch1", "Ethernet48", "firewall1", "ethernet1/1")
+]
 
-@app.route('/api/execute', methods=['POST'])
-def execute_command():
-    data = request.json
-    query = data.get('query', '')
-    
-    # Process the natural language query
-    response = process_natural_language(query)
-    
-    # Check for anomalies using AI
-    anomalies = analyze_network_anomalies(NETWORK_DEVICES)
-    if anomalies:
-        response["anomalies"] = anomalies
-    
-    return jsonify(response)
+def simulate_lldp_neighbors(device_id):
+    """Simulate a NAPALM get_lldp_neighbors_detail result for a device"""
+    neighbors = {}
+    for a, a_port, b, b_port in SIMULATED_LLDP_LINKS:
+        if device_id == a:
+            neighbors.setdefault(a_port, []).append({"remote_system_name": b, "remote_port": b_port})
+        elif device_id == b:
+            neighbors.setdefault(b_port, []).append({"remote_system_name": a, "remote_port": a_port})
+    return neighbors
 
-@app.route('/api/explain', methods=['POST'])
-def explain_command():
-    """Endpoint to explain what a command does in plain English"""
-    data = request.json
-    command = data.get('command', '')
-    device_id = data.get('device_id', list(NETWORK_DEVICES.keys())[0])
-    device = NETWORK_DEVICES[device_id]
+def collect_lldp_neighbors(device_id):
+    """Get the LLDP neighbor table of a device in NAPALM get_lldp_neighbors_detail format"""
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("napalm"):
+        return simulate_lldp_neighbors(device_id)
     
-    try:
-        system_prompt = f"""
-        You are a network command explainer for {device['vendor']} {device['type']} devices.
-        Explain what the following command does in simple terms that a junior network engineer would understand.
-        Be concise but thorough.
-        """
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": command}
-            ],
-            max_tokens=300,
-            temperature=0.5
-        )
-        
-        explanation = response.choices[0].message.content.strip()
-        return jsonify({"explanation": explanation})
-    except Exception as e:
-        print(f"Error in command explanation: {e}")
-        return jsonify({"explanation": f"This command appears to be for {device['type']} configuration or monitoring."})
+    with device_circuit(device_id), napalm_session(device_id) as device_conn:
+        return device_conn.get_lldp_neighbors_detail()
 
-@app.route('/api/suggest', methods=['GET'])
-def suggest_commands():
-    """Endpoint to suggest common commands for a device"""
-    device_id = request.args.get('device_id', list(NETWORK_DEVICES.keys())[0])
-    device = NETWORK_DEVICES[device_id]
+def neighbor_name_map():
+    """Device IDs by device ID and hostname, built once per refresh instead of scanning the inventory per neighbor"""
+    names = {}
+    for device_id, device in NETWORK_DEVICES.items():
+        if device.get('hostname'):
+            names.setdefault(device['hostname'], device_id)
+        names[device_id] = device_id
+    return names
+
+def resolve_neighbor_name(name, names=None):
+    """Map an LLDP system name to a device ID when it is in the inventory"""
+    if name in NETWORK_DEVICES:
+        return name
+    if names is None:
+        names = neighbor_name_map()
+    return names.get(name.split('.')[0], name)
+
+def update_device_neighbors(device_id, neighbors, names=None):
+    """Replace the links reported by one device; returns True if the graph changed"""
+    if names is None:
+        names = neighbor_name_map()
+    links = set()
+    for local_port, entries in neighbors.items():
+        for entry in entries:
+            remote = entry.get('remote_system_name') or entry.get('remote_chassis_id')
+            if remote:
+                links.add((local_port, resolve_neighbor_name(remote, names), entry.get('remote_port', '')))
     
-    try:
-        system_prompt = f"""
-        You are a network command assistant for {device['vendor']} {device['type']} devices running {device['os']}.
-        Suggest 5 common and useful commands that network engineers might want to run on this device.
-        Return the suggestions as a JSON array of objects with 'command' and 'description' fields.
-        """
+    with TOPOLOGY_LOCK:
+        TOPOLOGY_STATE["updated"][device_id] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        previous = TOPOLOGY_REPORTED.get(device_id, set())
+        if links == previous:
+            return False
         
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Suggest commands for {device['vendor']} {device['model']}"}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
+        # Remove only this device's stale links, in both directions
+        for local_port, neighbor, remote_port in previous - links:
+            for a, b in ((device_id, neighbor), (neighbor, device_id)):
+                edge = TOPOLOGY_ADJACENCY.get(a, {}).get(b)
+                if edge is not None:
+                    edge.discard((device_id, local_port, remote_port))
+                    if not edge:
+                        del TOPOLOGY_ADJACENCY[a][b]
+            # Unmanaged neighbors only exist through links, so drop them with their last one
+            if neighbor not in TOPOLOGY_REPORTED and not TOPOLOGY_ADJACENCY.get(neighbor):
+                TOPOLOGY_ADJACENCY.pop(neighbor, None)
         
-        suggestions = json.loads(response.choices[0].message.content.strip())
-        return jsonify({"suggestions": suggestions})
-    except Exception as e:
-        print(f"Error in command suggestions: {e}")
-        # Fallback suggestions
-        fallback_suggestions = [
-            {"command": "show interfaces", "description": "Display interface status and statistics"},
-            {"command": "show running-config", "description": "Display the current configuration"},
-            {"command": "show ip route", "description": "Display the routing table"},
-            {"command": "show version", "description": "Display device hardware and software information"},
-            {"command": "show log", "description": "Display system logs"}
-        ]
-        return jsonify({"suggestions": fallback_suggestions})
+        for local_port, neighbor, remote_port in links - previous:
+            for a, b in ((device_id, neighbor), (neighbor, device_id)):
+                TOPOLOGY_ADJACENCY.setdefault(a, {}).setdefault(b, set()).add((device_id, local_port, remote_port))
+        
+        TOPOLOGY_ADJACENCY.setdefault(device_id, {})
+        TOPOLOGY_REPORTED[device_id] = links
+        TOPOLOGY_STATE["version"] += 1
+        return True
 
-@app.route('/api/discover', methods=['POST'])
-def discover_devices():
-    """Endpoint to discover network devices in a subnet"""
-    data = request.json
-    subnet = data.get('subnet', '192.168.1.0/24')
+def refresh_topology(device_ids=None, priority="background"):
+    """Collect neighbor tables concurrently and update the graph; returns the devices whose links changed"""
+    device_ids = list(device_ids or NETWORK_DEVICES.keys())
+    names = neighbor_name_map()
+    changed = []
     
-    # Start discovery in a background thread to avoid blocking
-    def run_discovery():
-        global NETWORK_DEVICES
-        discovered = discover_network_devices(subnet)
-        
-        # Update the global device list with new discoveries
-        for device in discovered:
-            if 'ip' in device and device['ip'] not in [d['ip'] for d in NETWORK_DEVICES.values()]:
-                device_id = f"device_{len(NETWORK_DEVICES) + 1}"
-                NETWORK_DEVICES[device_id] = device
+    def refresh_device(device_id):
+        try:
+            return collect_lldp_neighbors(device_id)
+        except Exception as e:
+            log_error("topology", f"Error collecting LLDP neighbors from {device_id}: {e}", device_id)
+            return None
     
-    threading.Thread(target=run_discovery).start()
+    with track_stage("refresh_topology", devices=len(device_ids)):
+        futures = [submit_device_task(device_id, priority, refresh_device, device_id) for device_id in device_ids]
+        for device_id, future in zip(device_ids, futures):
+            neighbors = future.result()
+            if neighbors is not None and update_device_neighbors(device_id, neighbors, names):
+                changed.append(device_id)
     
-    return jsonify({"message": f"Discovery started for subnet {subnet}. Check back soon for results."})
+    return changed
 
-@app.route('/api/backup', methods=['POST'])
-def backup_config():
+def get_topology_snapshot():
+    """Return the graph as nodes and links, serialized once per topology version"""
+    with TOPOLOGY_LOCK:
+        # Refresh times change without a graph change, so they are not part of the cached graph
+        if TOPOLOGY_STATE["cache_version"] == TOPOLOGY_STATE["version"]:
+            return dict(TOPOLOGY_STATE["cache"], updated=dict(TOPOLOGY_STATE["updated"]))
+        
+        nodes = []
+        for node in sorted(TOPOLOGY_ADJACENCY):
+            device = NETWORK_DEVICES.get(node, {})
+            nodes.append({
+                "id": node,
+                "type": device.get("type", "unknown"),
+                "vendor": device.get("vendor", "Unknown"),
+                "managed": node in NETWORK_DEVICES,
+                "degree": len(TOPOLOGY_ADJACENCY[node])
+            })
+        
+        links = []
+        for a in sorted(TOPOLOGY_ADJACENCY):
+            for b, ports in sorted(TOPOLOGY_ADJACENCY[a].items()):
+                if a < b:
+                    links.append({
+                        "source": a,
+                        "target": b,
+                        "ports": [{"reporter": r, "local_port": lp, "remote_port": rp} for r, lp, rp in sorted(ports)]
+                    })
+        
+        TOPOLOGY_STATE["cache"] = {
+            "version": TOPOLOGY_STATE["version"],
+            "nodes": nodes,
+            "links": links
+        }
+        TOPOLOGY_STATE["cache_version"] = TOPOLOGY_STATE["version"]
+        return dict(TOPOLOGY_STATE["cache"], updated=dict(TOPOLOGY_STATE["updated"]))
+
+def find_topology_path(source, target):
+    """Shortest path between two nodes by hop count, or None if they are not connected"""
+    with TOPOLOGY_LOCK:
+        if source not in TOPOLOGY_ADJACENCY or target not in TOPOLOGY_ADJACENCY:
+            return None
+        
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            for neighbor in TOPOLOGY_ADJACENCY[node]:
+                if neighbor not in previous:
+                    previous[neighbor] = node
+                    queue.append(neighbor)
+    return None
+
+def get_blast_radius(device_id, root=None):
+    """Nodes that lose their path to root if device_id fails"""
+    with TOPOLOGY_LOCK:
+        if device_id not in TOPOLOGY_ADJACENCY or (root is not None and root not in TOPOLOGY_ADJACENCY):
+            return None
+        
+        if root is None or root == device_id:
+            # Default to the best connected other node as the network core
+            candidates = [node for node in TOPOLOGY_ADJACENCY if node != device_id]
+            if not candidates:
+                return {"device": device_id, "root": None, "neighbors": [], "isolated": []}
+            root = max(candidates, key=lambda node: (len(TOPOLOGY_ADJACENCY[node]), node in NETWORK_DEVICES))
+        
+        reachable = {root}
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for neighbor in TOPOLOGY_ADJACENCY.get(node, {}):
+                if neighbor != device_id and neighbor not in reachable:
+                    reachable.add(neighbor)
+                    queue.append(neighbor)
+        
+        isolated = sorted(node for node in TOPOLOGY_ADJACENCY if node not in reachable and node != device_id)
+        return {
+            "device": device_id,
+            "root": root,
+            "neighbors": sorted(TOPOLOGY_ADJACENCY[device_id]),
+            "isolated": isolated
+        }
+
+# Full-text index over the latest configuration backup of each device. Configs
+# are split into stanzas (a top-level line plus its indented children); words map
+# to stanzas through an inverted index, and IPv4 addresses/networks are indexed by
+# octet boundary so prefix queries only verify a small candidate set.
+BACKUP_FILENAME_PATTERN = re.compile(r'^(?P<device>.+)_(?P<time>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.cfg$')
+CONFIG_TOKEN_PATTERN = re.compile(r'[a-z0-9][a-z0-9_.:/\-]*')
+IPV4_PATTERN = re.compile(r'^\d{1,3}(\.\d{1,3}){3}(/\d{1,2})?$')
+IP_INDEX_BOUNDARIES = (0, 8, 16, 24)
+
+CONFIG_INDEX_LOCK = threading.Lock()
+CONFIG_INDEX = {
+    "postings": {},      # term -> set of stanza ids
+    "stanzas": {},       # stanza id -> {"device", "file", "line", "text", "terms", "networks"}
+    "files": {},         # backup path -> list of stanza ids
+    "device_files": {},  # device_id -> (backup time, path) of the indexed backup
+    "seen": set(),       # every backup path already considered
+    "next_id": 0
+}
+
+def split_config_stanzas(config):
+    """Split a configuration into top-level stanzas with their indented children"""
+    stanzas = []
+    current = None
+    for number, line in enumerate(config.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped[0] in '!#' or stripped in ('{', '}'):
+            continue
+        if line[0] in ' \t' and current is not None:
+            current['lines'].append(line.rstrip())
+        else:
+            current = {'line': number, 'lines': [line.rstrip()]}
+            stanzas.append(current)
+    return [{'line': s['line'], 'text': '\n'.join(s['lines'])} for s in stanzas]
+
+def parse_config_tree(config):
+    """Nest configuration lines by indentation; returns the top-level blocks.
+    
+    Each block is {'line', 'header', 'children', 'lines'}, where 'lines' holds every
+    line indented under the header at any depth.
+    """
+    root = {'children': [], 'lines': []}
+    stack = [(-1, root)]
+    for number, line in enumerate(config.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped[0] in '!#' or stripped in ('{', '}'):
+            continue
+        indent = len(line) - len(line.lstrip(' \t'))
+        while stack[-1][0] >= indent:
+            stack.pop()
+        block = {'line': number, 'header': line.rstrip(), 'children': [], 'lines': []}
+        for _, ancestor in stack[1:]:
+            ancestor['lines'].append(line.rstrip())
+        stack[-1][1]['children'].append(block)
+        stack.append((indent, block))
+    return root['children']
+
+def is_mask_token(token):
+    """Check whether a dotted quad looks like a netmask or wildcard rather than an address"""
+    return '/' not in token and bool(IPV4_PATTERN.match(token)) and token.startswith(('255.', '0.'))
+
+def extract_ipv4_networks(text):
+    """Find IPv4 addresses and networks, including 'address mask' and 'address wildcard' pairs.
+    
+    Masks are not addresses, and a default route (/0) would overlap every query, so
+    neither is indexed as a network; both remain searchable as literal words.
+    """
+    networks = set()
+    tokens = text.split()
+    for i, token in enumerate(tokens):
+        if not IPV4_PATTERN.match(token):
+            continue
+        try:
+            if '/' not in token and i + 1 < len(tokens) and is_mask_token(tokens[i + 1]):
+                networks.add(ipaddress.IPv4Network(f"{token}/{tokens[i + 1]}", strict=False))
+            if not is_mask_token(token):
+                networks.add(ipaddress.IPv4Network(token, strict=False))
+        except ValueError:
+            continue
+    return {network for network in networks if network.prefixlen}
+
+def _ip_key(kind, network, boundary):
+    """Index key for a network truncated to an octet boundary"""
+    octets = str(network.network_address).split('.')[:boundary // 8]
+    return f"ip4:{kind}/{boundary}:{'.'.join(octets)}"
+
+def ip_index_terms(network):
+    """Terms under which a network is indexed: its own boundary plus every coarser one for containment lookups"""
+    floor = min(24, network.prefixlen // 8 * 8)
+    terms = {_ip_key("net", network, floor)}
+    for boundary in IP_INDEX_BOUNDARIES:
+        if boundary <= floor:
+            terms.add(_ip_key("sub", network, boundary))
+    return terms
+
+def ip_query_terms(network):
+    """Terms whose stanzas may overlap the queried network"""
+    floor = min(24, network.prefixlen // 8 * 8)
+    terms = {_ip_key("sub", network, floor)}
+    for boundary in IP_INDEX_BOUNDARIES:
+        if boundary <= floor:
+            terms.add(_ip_key("net", network, boundary))
+    return terms
+
+def _remove_indexed_file(path):
+    """Drop every stanza of a backup file from the index"""
+    for stanza_id in CONFIG_INDEX["files"].pop(path, []):
+        stanza = CONFIG_INDEX["stanzas"].pop(stanza_id)
+        for term in stanza["terms"]:
+            postings = CONFIG_INDEX["postings"].get(term)
+            if postings is not None:
+                postings.discard(stanza_id)
+                if not postings:
+                    del CONFIG_INDEX["postings"][term]
+
+def index_config_backup(path):
+    """Index a backup file if it is the newest one for its device; returns True if indexed"""
+    match = BACKUP_FILENAME_PATTERN.match(os.path.basename(path))
+    if not match:
+        return False
+    device_id = match.group('device')
+    backup_time = match.group('time')
+    
+    with CONFIG_INDEX_LOCK:
+        CONFIG_INDEX["seen"].add(path)
+        current = CONFIG_INDEX["device_files"].get(device_id)
+        if current and current[0] >= backup_time:
+            return False
+    
+    with open(path, 'r', errors='replace') as f:
+        stanzas = split_config_stanzas(f.read())
+    
+    prepared = []
+    for stanza in stanzas:
+        networks = extract_ipv4_networks(stanza['text'])
+        terms = set(CONFIG_TOKEN_PATTERN.findall(stanza['text'].lower()))
+        for network in networks:
+            terms |= ip_index_terms(network)
+        prepared.append((stanza, terms, networks))
+    
+    with CONFIG_INDEX_LOCK:
+        current = CONFIG_INDEX["device_files"].get(device_id)
+        if current and current[0] >= backup_time:
+            return False
+        if current:
+            _remove_indexed_file(current[1])
+        
+        stanza_ids = []
+        for stanza, terms, networks in prepared:
+            stanza_id = CONFIG_INDEX["next_id"]
+            CONFIG_INDEX["next_id"] += 1
+            CONFIG_INDEX["stanzas"][stanza_id] = {
+                "device": device_id,
+                "file": path,
+                "line": stanza['line'],
+                "text": stanza['text'],
+                "terms": terms,
+                "networks": networks
+            }
+            for term in terms:
+                CONFIG_INDEX["postings"].setdefault(term, set()).add(stanza_id)
+            stanza_ids.append(stanza_id)
+        
+        CONFIG_INDEX["files"][path] = stanza_ids
+        CONFIG_INDEX["device_files"][device_id] = (backup_time, path)
+    
+    return True
+
+def sync_config_index(directory="backups"):
+    """Index backups written since the last sync, e.g. by another worker"""
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.cfg') and entry.path not in CONFIG_INDEX["seen"]:
+            try:
+                index_config_backup(entry.path)
+            except OSError as e:
+                log_error("config_index", f"Error indexing {entry.path}: {e}")
+
+def search_configs(query, device_id=None, limit=50):
+    """Find stanzas in the latest backups matching every term of the query"""
+    terms = query.split()
+    if not terms:
+        return []
+    
+    with CONFIG_INDEX_LOCK:
+        candidates = None
+        ip_filters = []
+        for term in terms:
+            try:
+                # Masks and wildcards are matched as literal words
+                network = ipaddress.IPv4Network(term, strict=False) if IPV4_PATTERN.match(term) and not is_mask_token(term) else None
+            except ValueError:
+                network = None
+            
+            if network is not None:
+                ip_filters.append(network)
+                matches = set()
+                for key in ip_query_terms(network):
+                    matches |= CONFIG_INDEX["postings"].get(key, set())
+            else:
+                matches = None
+                for token in CONFIG_TOKEN_PATTERN.findall(term.lower()):
+                    token_matches = CONFIG_INDEX["postings"].get(token, set())
+                    matches = token_matches if matches is None else matches & token_matches
+                if matches is None:
+                    continue
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+        
+        if candidates is None:
+            return []
+        
+        results = []
+        for stanza_id in sorted(candidates, key=lambda i: (CONFIG_INDEX["stanzas"][i]["device"], CONFIG_INDEX["stanzas"][i]["line"])):
+            stanza = CONFIG_INDEX["stanzas"][stanza_id]
+            if device_id and stanza["device"] != device_id:
+                continue
+            # Candidates from octet boundaries are verified against the exact prefix
+            if any(not any(n.overlaps(network) for n in stanza["networks"]) for network in ip_filters):
+                continue
+            results.append({
+                "device": stanza["device"],
+                "file": stanza["file"],
+                "line": stanza["line"],
+                "stanza": stanza["text"]
+            })
+            if len(results) >= limit:
+                break
+    
+    return results
+
+# Large command outputs and configs are spooled to a temporary file (kept in
+# memory up to LARGE_OUTPUT_SPOOL_MEMORY), split along stanza/table boundaries and
+# served page by page instead of in one JSON body. Chunks can be filtered, parsed
+# or summarized in parallel and the per-chunk results merged. Spools live in the
+# process that created them unless LARGE_OUTPUT_DIR names a directory shared by
+# all workers; then they are written there with a small JSON sidecar (chunk map)
+# so a page request landing on another worker can open them.
+LARGE_OUTPUT_DIR = os.getenv("LARGE_OUTPUT_DIR", "")
+LARGE_OUTPUT_THRESHOLD = int(os.getenv("LARGE_OUTPUT_THRESHOLD", "65536"))
+OUTPUT_CHUNK_SIZE = int(os.getenv("OUTPUT_CHUNK_SIZE", "32768"))
+LARGE_OUTPUT_SPOOL_MEMORY = int(os.getenv("LARGE_OUTPUT_SPOOL_MEMORY", "1048576"))
+LARGE_OUTPUT_MAX_ENTRIES = 100
+LARGE_OUTPUT_TTL = 3600
+
+# output_id -> {"device", "command", "spool", "chunks": [(offset, length, first_line)], "size", "lines", "created"}
+LARGE_OUTPUTS = OrderedDict()
+LARGE_OUTPUTS_LOCK = threading.Lock()
+
+def _evict_large_outputs():
+    """Drop expired outputs and the oldest ones beyond the entry limit; caller holds the lock"""
+    now = time.time()
+    while LARGE_OUTPUTS:
+        output_id, entry = next(iter(LARGE_OUTPUTS.items()))
+        if len(LARGE_OUTPUTS) <= LARGE_OUTPUT_MAX_ENTRIES and now - entry['created'] < LARGE_OUTPUT_TTL:
+            break
+        # Wait for in-progress reads; later readers see the closed spool
+        with entry['lock']:
+            LARGE_OUTPUTS.pop(output_id)['spool'].close()
+        if LARGE_OUTPUT_DIR and now - entry['created'] >= LARGE_OUTPUT_TTL:
+            _remove_shared_output(output_id)
+
+def _shared_output_paths(output_id):
+    return os.path.join(LARGE_OUTPUT_DIR, f"{output_id}.out"), os.path.join(LARGE_OUTPUT_DIR, f"{output_id}.json")
+
+def _remove_shared_output(output_id):
+    for path in _shared_output_paths(output_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _sweep_shared_outputs():
+    """Delete shared spools past their TTL, whichever worker created them"""
+    cutoff = time.time() - LARGE_OUTPUT_TTL
+    for entry in os.scandir(LARGE_OUTPUT_DIR):
+        if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+            _remove_shared_output(entry.name[:-5])
+
+def get_large_output(output_id):
+    """Look up a spooled output, opening it from LARGE_OUTPUT_DIR if another worker wrote it; None if unknown"""
+    with LARGE_OUTPUTS_LOCK:
+        entry = LARGE_OUTPUTS.get(output_id)
+        if entry is not None or not LARGE_OUTPUT_DIR or not re.fullmatch(r'[0-9a-f]{32}', output_id):
+            return entry
+        
+        spool_path, meta_path = _shared_output_paths(output_id)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            spool = open(spool_path, 'rb')
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta['created'] >= LARGE_OUTPUT_TTL:
+            spool.close()
+            return None
+        
+        entry = dict(meta, chunks=[tuple(chunk) for chunk in meta['chunks']], spool=spool, lock=threading.Lock())
+        LARGE_OUTPUTS[output_id] = entry
+        _evict_large_outputs()
+        return entry
+
+def spool_output(device_id, command, lines):
+    """Write output lines to a spooled buffer, recording chunk boundaries; returns the output ID"""
+    output_id = uuid.uuid4().hex
+    if LARGE_OUTPUT_DIR:
+        os.makedirs(LARGE_OUTPUT_DIR, exist_ok=True)
+        _sweep_shared_outputs()
+        spool = open(_shared_output_paths(output_id)[0], 'w+b')
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=LARGE_OUTPUT_SPOOL_MEMORY, mode='w+b')
+    chunks = []
+    chunk_start = 0
+    chunk_first_line = 1
+    offset = 0
+    line_number = 0
+    
+    for line in lines:
+        line_number += 1
+        data = line.encode('utf-8', errors='replace')
+        chunk_size = offset - chunk_start
+        # Split before a top-level line (new config stanza or table row) once the chunk is
+        # full, or anywhere if a single stanza grows far beyond the chunk size
+        if chunk_size >= OUTPUT_CHUNK_SIZE and (not line[:1].isspace() or chunk_size >= 4 * OUTPUT_CHUNK_SIZE):
+            chunks.append((chunk_start, chunk_size, chunk_first_line))
+            chunk_start = offset
+            chunk_first_line = line_number
+        spool.write(data)
+        offset += len(data)
+    
+    if offset > chunk_start or not chunks:
+        chunks.append((chunk_start, offset - chunk_start, chunk_first_line))
+    
+    meta = {
+        'device': device_id,
+        'command': command,
+        'chunks': chunks,
+        'size': offset,
+        'lines': line_number,
+        'created': time.time()
+    }
+    if LARGE_OUTPUT_DIR:
+        # The sidecar is written last, so other workers never see a partial spool
+        spool.flush()
+        meta_path = _shared_output_paths(output_id)[1]
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+    
+    with LARGE_OUTPUTS_LOCK:
+        LARGE_OUTPUTS[output_id] = dict(meta, spool=spool, lock=threading.Lock())
+        _evict_large_outputs()
+    
+    return output_id
+
+def read_output_chunk(output_id, index):
+    """Return the text of one chunk, or None if the output or chunk doesn't exist"""
+    entry = get_large_output(output_id)
+    if entry is None:
+        return None
+    return _read_entry_chunk(entry, index)
+
+def _read_entry_chunk(entry, index):
+    """Return the text of one chunk of an entry, or None if it is out of range or was evicted"""
+    if not 0 <= index < len(entry['chunks']):
+        return None
+    
+    offset, length, _ = entry['chunks'][index]
+    with entry['lock']:
+        if entry['spool'].closed:
+            return None
+        entry['spool'].seek(offset)
+        return entry['spool'].read(length).decode('utf-8', errors='replace')
+
+def paginate_large_output(device_id, command, output):
+    """Spool outputs over LARGE_OUTPUT_THRESHOLD; returns (first page, page info or None)"""
+    if not isinstance(output, str) or len(output) <= LARGE_OUTPUT_THRESHOLD:
+        return output, None
+    
+    output_id = spool_output(device_id, command, output.splitlines(keepends=True))
+    entry = get_large_output(output_id)
+    return _read_entry_chunk(entry, 0), {
+        "output_id": output_id,
+        "pages": len(entry['chunks']),
+        "size": entry['size'],
+        "lines": entry['lines']
+    }
+
+def _filter_chunk(text, first_line, pattern):
+    """Map step for 'filter': matching lines with their line numbers"""
+    return [
+        {"line": first_line + i, "text": line}
+        for i, line in enumerate(text.splitlines())
+        if pattern.search(line)
+    ]
+
+def _parse_chunk(text, first_line, pattern):
+    """Map step for 'parse': top-level stanzas or table rows with their child line counts"""
+    return [
+        {"line": first_line + stanza['line'] - 1, "header": stanza['text'].splitlines()[0], "children": stanza['text'].count('\n')}
+        for stanza in split_config_stanzas(text)
+        if pattern is None or pattern.search(stanza['text'])
+    ]
+
+def _summarize_chunk(text, first_line, pattern, device, command):
+    """Map step for 'summarize': a model summary of one chunk"""
+    try:
+        response = create_chat_completion(
+            "summarize_chunk",
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": f"You are a network engineer reviewing part of the output of '{command}' from a {device['vendor']} {device['type']}. Summarize the notable facts, problems and counts in this section in a few bullet points."},
+                {"role": "user", "content": text}
+            ],
+            max_tokens=300,
+            temperature=0.2
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        log_error("summarize_chunk", f"Error summarizing output chunk: {e}")
+        lines = text.splitlines()
+        return f"Lines {first_line}-{first_line + len(lines) - 1}: {len(lines)} lines, {len(split_config_stanzas(text))} top-level entries"
+
+def process_large_output(output_id, operation, pattern=None):
+    """Run filter, parse or summarize over all chunks in parallel and merge the results"""
+    entry = get_large_output(output_id)
+    if entry is None:
+        return None
+    
+    regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+    if operation == 'filter' and regex is None:
+        raise ValueError("A pattern is required for the filter operation")
+    
+    device = NETWORK_DEVICES.get(entry['device'], {"vendor": "Unknown", "type": "device"})
+    
+    def map_chunk(index):
+        text = _read_entry_chunk(entry, index)
+        if text is None:
+            return None
+        first_line = entry['chunks'][index][2]
+        if operation == 'filter':
+            return _filter_chunk(text, first_line, regex)
+        elif operation == 'parse':
+            return _parse_chunk(text, first_line, regex)
+        return _summarize_chunk(text, first_line, regex, device, entry['command'])
+    
+    with track_stage("process_large_output", operation=operation, chunks=len(entry['chunks'])):
+        with ThreadPoolExecutor(max_workers=min(8, len(entry['chunks']))) as executor:
+            mapped = list(executor.map(map_chunk, range(len(entry['chunks']))))
+    
+    # The output was evicted while the chunks were being read
+    if any(chunk is None for chunk in mapped):
+        return None
+    
+    # Reduce: chunks are already in output order
+    if operation in ('filter', 'parse'):
+        return {"operation": operation, "results": [item for chunk in mapped for item in chunk]}
+    
+    if len(mapped) == 1:
+        return {"operation": operation, "summary": mapped[0], "chunk_summaries": mapped}
+    
+    try:
+        response = create_chat_completion(
+            "merge_summaries",
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": f"Combine these section summaries of the output of '{entry['command']}' into one concise summary for a network engineer."},
+                {"role": "user", "content": "\n\n".join(f"Section {i + 1}:\n{summary}" for i, summary in enumerate(mapped))}
+            ],
+            max_tokens=500,
+            temperature=0.2
+        )
+        summary = response.choices[0].message.content.strip()
+    except Exception as e:
+        log_error("merge_summaries", f"Error merging output summaries: {e}")
+        summary = "\n".join(mapped)
+    
+    return {"operation": operation, "summary": summary, "chunk_summaries": mapped}
+
+# Append-only audit journal. Request threads only enqueue entries; a background
+# writer appends them in batches with one fsync per batch, rotates segments by
+# size or age, gzips closed segments and keeps a small per-segment index (time
+# range, devices, users) so queries skip segments that cannot match. Each worker
+# writes its own segments (the pid is part of the name); queries rescan the
+# directory, so segments written or rotated by other workers are picked up.
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit")
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+AUDIT_SEGMENT_SECONDS = int(os.getenv("AUDIT_SEGMENT_SECONDS", "86400"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.05"))
+AUDIT_BATCH_SIZE = 2000
+AUDIT_QUEUE = queue.Queue(maxsize=int(os.getenv("AUDIT_QUEUE_SIZE", "100000")))
+
+AUDIT_LOCK = threading.Lock()
+AUDIT_STATE = {"writer": None, "file": None, "active": None, "segments": {}}  # segments: index cache by file path
+
+def get_request_user():
+    """Identify the caller for the audit journal from the authenticated user, not client headers"""
+    return request.remote_user or request.remote_addr or "anonymous"
+
+def audit_event(action, device=None, command=None, status="ok", user=None, **details):
+    """Record an agent action without blocking the caller"""
+    entry = {
+        "ts": datetime.now().isoformat(),
+        "epoch": time.time(),
+        "action": action,
+        "device": device,
+        "user": user,
+        "command": command,
+        "status": status
+    }
+    if has_request_context() and request.headers.get('X-User'):
+        # Unverified: kept for reference, never used as the audit user
+        details.setdefault("claimed_user", request.headers['X-User'])
+    if details:
+        entry["details"] = details
+    
+    _start_audit_writer()
+    try:
+        AUDIT_QUEUE.put_nowait(entry)
+    except queue.Full:
+        increment_counter("network_agent_audit_dropped_total")
+
+def _new_segment_meta(path):
+    return {"path": path, "start": None, "end": None, "devices": set(), "users": set(), "count": 0, "bytes": 0, "opened": time.time()}
+
+def _open_audit_segment():
+    """Start a new active segment; caller holds AUDIT_LOCK"""
+    os.makedirs(AUDIT_LOG_DIR, exist_ok=True)
+    name = f"audit-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}.jsonl"
+    path = os.path.join(AUDIT_LOG_DIR, name)
+    AUDIT_STATE["file"] = open(path, 'ab')
+    AUDIT_STATE["active"] = _new_segment_meta(path)
+
+def _save_segment_index(meta):
+    """Write the sidecar index for a closed segment"""
+    with open(meta["path"] + ".idx.json", 'w') as f:
+        json.dump({
+            "path": meta["path"],
+            "start": meta["start"],
+            "end": meta["end"],
+            "devices": sorted(d for d in meta["devices"] if d),
+            "users": sorted(u for u in meta["users"] if u),
+            "count": meta["count"]
+        }, f)
+
+def _rotate_audit_segment():
+    """Close and compress the active segment; caller holds AUDIT_LOCK"""
+    meta = AUDIT_STATE["active"]
+    AUDIT_STATE["file"].close()
+    AUDIT_STATE["file"] = None
+    AUDIT_STATE["active"] = None
+    
+    if meta["count"]:
+        # The plain segment goes last, so readers always find one complete copy
+        plain_path = meta["path"]
+        with open(plain_path, 'rb') as source, gzip.open(plain_path + ".gz", 'wb') as target:
+            shutil.copyfileobj(source, target)
+        meta["path"] = plain_path + ".gz"
+        _save_segment_index(meta)
+        AUDIT_STATE["segments"][meta["path"] + ".idx.json"] = meta
+        os.remove(plain_path)
+    else:
+        os.remove(meta["path"])
+
+def _write_audit_batch(batch):
+    """Append a batch of entries with a single fsync and update the segment index"""
+    with AUDIT_LOCK:
+        if AUDIT_STATE["file"] is None:
+            _open_audit_segment()
+        meta = AUDIT_STATE["active"]
+        
+        data = b"".join(json.dumps(entry, default=str).encode() + b"\n" for entry in batch)
+        AUDIT_STATE["file"].write(data)
+        AUDIT_STATE["file"].flush()
+        os.fsync(AUDIT_STATE["file"].fileno())
+        
+        for entry in batch:
+            meta["start"] = entry["epoch"] if meta["start"] is None else min(meta["start"], entry["epoch"])
+            meta["end"] = entry["epoch"] if meta["end"] is None else max(meta["end"], entry["epoch"])
+            meta["devices"].add(entry["device"])
+            meta["users"].add(entry["user"])
+        meta["count"] += len(batch)
+        meta["bytes"] += len(data)
+        
+        if meta["bytes"] >= AUDIT_SEGMENT_BYTES or time.time() - meta["opened"] >= AUDIT_SEGMENT_SECONDS:
+            _rotate_audit_segment()
+    
+    increment_counter("network_agent_audit_entries_total", len(batch))
+
+def _audit_writer():
+    """Background writer: drain the queue in batches"""
+    while True:
+        batch = [AUDIT_QUEUE.get()]
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(AUDIT_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            with track_stage("audit_flush"):
+                _write_audit_batch(batch)
+        except Exception as e:
+            log_error("audit", f"Error writing audit journal: {e}")
+        finally:
+            for _ in batch:
+                AUDIT_QUEUE.task_done()
+
+def _audit_segment_owner_alive(name):
+    """Whether the process that writes a plain segment is still running"""
+    match = re.fullmatch(r'audit-\d{8}-\d{6}-(\d+)-[0-9a-f]{6}\.jsonl', name)
+    if not match or int(match.group(1)) == os.getpid():
+        return False
+    try:
+        os.kill(int(match.group(1)), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def _scan_audit_segments():
+    """List the segments on disk: indexed closed segments, plain segments left behind by stopped
+    processes, and unindexed plain segments other workers are still writing"""
+    if not os.path.isdir(AUDIT_LOG_DIR):
+        return []
+    names = set(os.listdir(AUDIT_LOG_DIR))
+    active = AUDIT_STATE["active"]
+    cache = {path: meta for path, meta in AUDIT_STATE["segments"].items() if os.path.basename(path) in names}
+    
+    segments = []
+    for name in sorted(names):
+        path = os.path.join(AUDIT_LOG_DIR, name)
+        if name.endswith(".idx.json"):
+            meta = cache.get(path)
+            if meta is None:
+                try:
+                    with open(path, 'r') as f:
+                        saved = json.load(f)
+                except (OSError, ValueError):
+                    # Removed, or still being written by the rotating worker
+                    continue
+                meta = _new_segment_meta(saved["path"])
+                meta.update({"start": saved["start"], "end": saved["end"], "count": saved["count"],
+                             "devices": set(saved["devices"]), "users": set(saved["users"])})
+                cache[path] = meta
+            segments.append(meta)
+        elif name.endswith(".jsonl") and name + ".gz.idx.json" not in names and not (active and active["path"] == path):
+            if _audit_segment_owner_alive(name):
+                segments.append(dict(_new_segment_meta(path), live=True))
+                continue
+            # Segment that was active when its process stopped; it no longer changes
+            meta = cache.get(path)
+            if meta is None:
+                meta = _new_segment_meta(path)
+                for entry in _read_audit_segment(path):
+                    meta["start"] = entry["epoch"] if meta["start"] is None else min(meta["start"], entry["epoch"])
+                    meta["end"] = entry["epoch"] if meta["end"] is None else max(meta["end"], entry["epoch"])
+                    meta["devices"].add(entry.get("device"))
+                    meta["users"].add(entry.get("user"))
+                    meta["count"] += 1
+                cache[path] = meta
+            if meta["count"]:
+                segments.append(meta)
+    
+    AUDIT_STATE["segments"] = cache
+    return segments
+
+def _start_audit_writer():
+    """Start the writer thread on first use"""
+    if AUDIT_STATE["writer"] is not None:
+        return
+    with AUDIT_LOCK:
+        if AUDIT_STATE["writer"] is None:
+            writer = threading.Thread(target=_audit_writer, name="audit-writer", daemon=True)
+            writer.start()
+            AUDIT_STATE["writer"] = writer
+
+def flush_audit_log(timeout=5):
+    """Wait until queued audit entries have been written"""
+    if AUDIT_STATE["writer"] is None:
+        return
+    deadline = time.monotonic() + timeout
+    while AUDIT_QUEUE.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def _read_audit_segment(path):
+    """Yield entries from a plain or gzipped segment"""
+    if not path.endswith(".gz") and not os.path.exists(path):
+        # Rotated by its worker since the directory was scanned
+        path += ".gz"
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        f = opener(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Torn write at the end of a segment
+                continue
+
+def query_audit_log(device=None, user=None, since=None, until=None, command=None, action=None, limit=100):
+    """Return matching entries, newest first, skipping segments the index rules out"""
+    _start_audit_writer()
+    flush_audit_log()
+    with AUDIT_LOCK:
+        segments = _scan_audit_segments()
+        if AUDIT_STATE["active"] and AUDIT_STATE["active"]["count"]:
+            segments.append(dict(AUDIT_STATE["active"], devices=set(AUDIT_STATE["active"]["devices"]), users=set(AUDIT_STATE["active"]["users"])))
+    
+    results = []
+    # Other workers' unindexed segments may hold the newest entries, so they sort first
+    for meta in sorted(segments, key=lambda m: float('inf') if m.get("live") else m["end"] or 0, reverse=True):
+        if since is not None and meta["end"] is not None and meta["end"] < since:
+            continue
+        if until is not None and meta["start"] is not None and meta["start"] > until:
+            continue
+        if device and not meta.get("live") and device not in meta["devices"]:
+            continue
+        if user and not meta.get("live") and user not in meta["users"]:
+            continue
+        
+        matches = []
+        for entry in _read_audit_segment(meta["path"]):
+            if device and entry.get("device") != device:
+                continue
+            if user and entry.get("user") != user:
+                continue
+            if action and entry.get("action") != action:
+                continue
+            if since is not None and entry["epoch"] < since:
+                continue
+            if until is not None and entry["epoch"] > until:
+                continue
+            if command and command.lower() not in (entry.get("command") or "").lower():
+                continue
+            matches.append(entry)
+        
+        results.extend(reversed(matches))
+        if len(results) >= limit:
+            break
+    
+    results.sort(key=lambda entry: entry["epoch"], reverse=True)
+    return results[:limit]
+
+def close_audit_log():
+    """Flush pending entries and close and compress the active segment"""
+    flush_audit_log()
+    with AUDIT_LOCK:
+        if AUDIT_STATE["file"] is not None:
+            _rotate_audit_segment()
+
+# Priority-aware device scheduler. Device work is queued per device and dispatched
+# by a fixed pool of workers in priority order: interactive requests from the UI
+# first, then batch jobs (fleet commands, backups), then background sweeps
+# (topology). Batch and background work may not take the slots reserved for
+# interactive requests, so a bulk job cannot push an operator's query behind it.
+SCHEDULER_PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+SCHEDULER_GLOBAL_CONCURRENCY = int(os.getenv("SCHEDULER_GLOBAL_CONCURRENCY", "32"))
+SCHEDULER_DEVICE_CONCURRENCY = int(os.getenv("SCHEDULER_DEVICE_CONCURRENCY", "2"))
+SCHEDULER_INTERACTIVE_RESERVE = int(os.getenv("SCHEDULER_INTERACTIVE_RESERVE", "4"))
+
+SCHEDULER_CONDITION = threading.Condition()
+SCHEDULER_STATE = {
+    "queues": {},    # device_id -> heap of (priority, sequence, task)
+    "ready": {rank: [] for rank in SCHEDULER_PRIORITIES.values()},  # priority -> heap of (sequence, device_id) of queue heads
+    "running": {},   # device_id -> running task count
+    "running_total": 0,
+    "running_by_priority": {priority: 0 for priority in SCHEDULER_PRIORITIES},
+    "sequence": 0,
+    "workers": []
+}
+
+def get_request_priority(data, default):
+    """Read the priority class of a request, or None if it is not a known class"""
+    priority = (data.get('priority') or default).lower()
+    return priority if priority in SCHEDULER_PRIORITIES else None
+
+def _scheduler_limits(rank):
+    """Global and per-device slot limits for a priority rank"""
+    if rank == SCHEDULER_PRIORITIES["interactive"]:
+        return SCHEDULER_GLOBAL_CONCURRENCY, SCHEDULER_DEVICE_CONCURRENCY
+    return (max(1, SCHEDULER_GLOBAL_CONCURRENCY - SCHEDULER_INTERACTIVE_RESERVE),
+            max(1, SCHEDULER_DEVICE_CONCURRENCY - 1))
+
+def _mark_device_ready(device_id):
+    """Offer a device's queue head for dispatch if the device has a free slot for it; caller holds the condition"""
+    tasks = SCHEDULER_STATE["queues"].get(device_id)
+    if not tasks:
+        return
+    rank, sequence, _ = tasks[0]
+    if SCHEDULER_STATE["running"].get(device_id, 0) < _scheduler_limits(rank)[1]:
+        heapq.heappush(SCHEDULER_STATE["ready"][rank], (sequence, device_id))
+
+def _next_scheduled_task():
+    """Pick the highest-priority task that fits the concurrency limits; caller holds the condition.
+    
+    Ready entries are checked lazily: an entry is dropped once its task is no longer
+    the device's queue head (a higher-priority task arrived or it already ran) or the
+    device has no free slot; the device is offered again when one of its tasks ends.
+    """
+    for rank, ready in sorted(SCHEDULER_STATE["ready"].items()):
+        global_limit, device_limit = _scheduler_limits(rank)
+        if SCHEDULER_STATE["running_total"] >= global_limit:
+            continue
+        while ready:
+            sequence, device_id = heapq.heappop(ready)
+            tasks = SCHEDULER_STATE["queues"].get(device_id)
+            if not tasks or tasks[0][:2] != (rank, sequence):
+                continue
+            if SCHEDULER_STATE["running"].get(device_id, 0) >= device_limit:
+                continue
+            
+            task = heapq.heappop(tasks)[2]
+            if not tasks:
+                del SCHEDULER_STATE["queues"][device_id]
+            return task
+    return None
+
+def _scheduler_worker():
+    """Worker loop: run queued device tasks in priority order"""
+    while True:
+        with SCHEDULER_CONDITION:
+            task = _next_scheduled_task()
+            while task is None:
+                SCHEDULER_CONDITION.wait()
+                task = _next_scheduled_task()
+            device_id = task["device"]
+            SCHEDULER_STATE["running"][device_id] = SCHEDULER_STATE["running"].get(device_id, 0) + 1
+            SCHEDULER_STATE["running_total"] += 1
+            SCHEDULER_STATE["running_by_priority"][task["priority"]] += 1
+            _mark_device_ready(device_id)
+        
+        observe_histogram("network_agent_scheduler_wait_seconds", time.perf_counter() - task["queued"], priority=task["priority"])
+        
+        future = task["future"]
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(task["function"](*task["args"]))
+            except Exception as e:
+                future.set_exception(e)
+        
+        with SCHEDULER_CONDITION:
+            SCHEDULER_STATE["running"][device_id] -= 1
+            if not SCHEDULER_STATE["running"][device_id]:
+                del SCHEDULER_STATE["running"][device_id]
+            SCHEDULER_STATE["running_total"] -= 1
+            SCHEDULER_STATE["running_by_priority"][task["priority"]] -= 1
+            # This worker picks up the next task itself, so nobody else needs waking
+            _mark_device_ready(device_id)
+
+def _start_scheduler():
+    """Start the worker pool on first use; caller holds the condition"""
+    if SCHEDULER_STATE["workers"]:
+        return
+    for i in range(SCHEDULER_GLOBAL_CONCURRENCY):
+        worker = threading.Thread(target=_scheduler_worker, name=f"device-scheduler-{i}", daemon=True)
+        worker.start()
+        SCHEDULER_STATE["workers"].append(worker)
+
+def submit_device_task(device_id, priority, function, *args):
+    """Queue work against a device and return a Future for its result"""
+    future = Future()
+    task = {
+        "device": device_id,
+        "priority": priority,
+        "function": function,
+        "args": args,
+        "future": future,
+        "queued": time.perf_counter()
+    }
+    with SCHEDULER_CONDITION:
+        _start_scheduler()
+        SCHEDULER_STATE["sequence"] += 1
+        tasks = SCHEDULER_STATE["queues"].setdefault(device_id, [])
+        heapq.heappush(tasks, (SCHEDULER_PRIORITIES[priority], SCHEDULER_STATE["sequence"], task))
+        if tasks[0][2] is task:
+            _mark_device_ready(device_id)
+        SCHEDULER_CONDITION.notify()
+    increment_counter("network_agent_scheduler_tasks_total", priority=priority)
+    return future
+
+def run_device_task(device_id, priority, function, *args):
+    """Run work against a device through the scheduler and wait for its result"""
+    return submit_device_task(device_id, priority, function, *args).result()
+
+def get_scheduler_status():
+    """Current limits, running tasks and queue depths"""
+    with SCHEDULER_CONDITION:
+        queued = {priority: 0 for priority in SCHEDULER_PRIORITIES}
+        queued_by_device = {}
+        for device_id, tasks in SCHEDULER_STATE["queues"].items():
+            queued_by_device[device_id] = len(tasks)
+            for _, _, task in tasks:
+                queued[task["priority"]] += 1
+        
+        return {
+            "limits": {
+                "global": SCHEDULER_GLOBAL_CONCURRENCY,
+                "per_device": SCHEDULER_DEVICE_CONCURRENCY,
+                "interactive_reserve": SCHEDULER_INTERACTIVE_RESERVE
+            },
+            "running": SCHEDULER_STATE["running_total"],
+            "running_by_priority": dict(SCHEDULER_STATE["running_by_priority"]),
+            "running_by_device": dict(SCHEDULER_STATE["running"]),
+            "queued": queued,
+            "queued_by_device": queued_by_device
+        }
+
+# Semantic index of past translations. Queries are reduced to normalized terms
+# (wording variants folded, device names dropped) and stored as TF-IDF rows of a
+# NumPy matrix per device profile (vendor/OS). A query that is close enough to a
+# confirmed entry, with the same parameters (numbers, interface names, addresses),
+# reuses its command instead of calling the model. Model translations are kept as
+# candidates and confirmed automatically once the model has agreed with them
+# TRANSLATION_AUTO_CONFIRM times; operators can promote or demote any entry.
+# Entries are appended to a JSON-lines file as they change; the last line for an
+# ID wins. Workers share the file: each one reads the lines others appended before
+# using the index, IDs are random so they never collide, and compaction (on first
+# load) rewrites the file only under an exclusive lock that appends wait for.
+TRANSLATION_INDEX_PATH = os.getenv("TRANSLATION_INDEX_PATH", "translations.jsonl")
+TRANSLATION_MATCH_THRESHOLD = float(os.getenv("TRANSLATION_MATCH_THRESHOLD", "0.85"))
+TRANSLATION_AUTO_CONFIRM = int(os.getenv("TRANSLATION_AUTO_CONFIRM", "3"))
+TRANSLATION_STATUSES = ("candidate", "confirmed", "demoted")
+
+TRANSLATION_TOKEN_PATTERN = re.compile(r'[a-z0-9][a-z0-9_./:\-]*')
+TRANSLATION_STOPWORDS = {
+    "a", "an", "the", "me", "my", "on", "in", "of", "for", "to", "from", "at", "is", "are",
+    "all", "please", "can", "you", "could", "i", "want", "need", "current", "currently", "device"
+}
+# Only spellings of the same word: terms that select a different command
+# (lldp/cdp, state/health, running/startup) must stay distinct
+TRANSLATION_SYNONYMS = {
+    "list": "show", "display": "show", "view": "show", "print": "show", "get": "show", "what": "show",
+    "port": "interface", "int": "interface", "intf": "interface",
+    "configuration": "config",
+    "neighbour": "neighbor",
+    "ver": "version",
+    "util": "utilization"
+}
+
+TRANSLATION_LOCK = threading.Lock()
+TRANSLATION_INDEX = {
+    "entries": {},     # entry id -> {"id", "query", "profile", "command", "status", "confirmations", "hits", "created", "updated"}
+    "features": {},    # entry id -> (Counter of terms, parameter set)
+    "profiles": {},    # profile -> {"ids": [...], "document_frequency": {...}, "matrix": None or (ids, vocabulary, idf, matrix)}
+    "inode": None,     # file the index was read from; changes when another worker compacts it
+    "offset": 0,       # bytes of it read so far
+    "compacted": False
+}
+
+# Inventory size -> compiled alternation of every device ID, hostname and address.
+# The inventory only grows (discovery adds devices), so its size identifies it.
+DEVICE_NAME_LOCK = threading.Lock()
+DEVICE_NAME_PATTERN = {"current": (None, None)}
+
+def translation_profile(device):
+    """Translations are shared by devices with the same vendor and OS"""
+    return f"{device['vendor']}/{device['os']}"
+
+def _device_name_pattern():
+    """One regex matching any device name or address, rebuilt when the inventory changes"""
+    size, pattern = DEVICE_NAME_PATTERN["current"]
+    if size == len(NETWORK_DEVICES):
+        return pattern
+    with DEVICE_NAME_LOCK:
+        size = len(NETWORK_DEVICES)
+        if DEVICE_NAME_PATTERN["current"][0] != size:
+            names = {
+                str(name).lower() for device_id, device in list(NETWORK_DEVICES.items())
+                for name in (device_id, device.get('hostname'), device.get('ip')) if name
+            }
+            # Longest first, so a name is not cut short by another that starts it
+            alternation = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+            DEVICE_NAME_PATTERN["current"] = (size, re.compile(r'(?<![\w.])(?:' + alternation + r')(?![\w])') if names else None)
+        return DEVICE_NAME_PATTERN["current"][1]
+
+def normalize_translation_query(query):
+    """Reduce a query to (term counts, parameter set) for similarity matching"""
+    text = query.lower()
+    # Device names and addresses select the device, not the command
+    pattern = _device_name_pattern()
+    if pattern is not None:
+        text = pattern.sub(' ', text)
+    
+    terms = []
+    parameters = set()
+    for token in TRANSLATION_TOKEN_PATTERN.findall(text):
+        if any(c.isdigit() for c in token):
+            parameters.add(token)
+            continue
+        token = TRANSLATION_SYNONYMS.get(token, token)
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = TRANSLATION_SYNONYMS.get(token[:-1], token[:-1])
+        if token not in TRANSLATION_STOPWORDS:
+            terms.append(token)
+    
+    features = Counter(terms)
+    features.update(f"{a} {b}" for a, b in zip(terms, terms[1:]))
+    return features, frozenset(parameters)
+
+def _index_translation(entry, features=None):
+    """Add an entry to the in-memory index; caller holds TRANSLATION_LOCK"""
+    if features is None:
+        features = normalize_translation_query(entry["query"])
+    TRANSLATION_INDEX["entries"][entry["id"]] = entry
+    TRANSLATION_INDEX["features"][entry["id"]] = features
+    # IDF is computed within a profile, so only this profile's matrix goes stale
+    profile = TRANSLATION_INDEX["profiles"].setdefault(entry["profile"], {"ids": [], "document_frequency": {}, "matrix": None})
+    profile["ids"].append(entry["id"])
+    for term in features[0]:
+        profile["document_frequency"][term] = profile["document_frequency"].get(term, 0) + 1
+    profile["matrix"] = None
+
+@contextmanager
+def _translation_file_lock(exclusive=False):
+    """Appends share the lock; compaction takes it exclusively so no append lands in the replaced file"""
+    if fcntl is None:
+        yield
+        return
+    with open(TRANSLATION_INDEX_PATH + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_translation_lines(data):
+    """Parse complete JSON lines, skipping any cut short by a crash"""
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        # IDs were sequential integers before they were made random
+        entry["id"] = str(entry["id"])
+        yield entry
+
+def _compact_translations():
+    """Rewrite the file with one line per entry, re-reading it under the exclusive lock"""
+    with _translation_file_lock(exclusive=True):
+        with open(TRANSLATION_INDEX_PATH, 'rb') as f:
+            saved = list(_read_translation_lines(f.read()))
+        entries = {entry["id"]: entry for entry in saved}
+        if len(saved) == len(entries):
+            return
+        temp_path = TRANSLATION_INDEX_PATH + ".tmp"
+        with open(temp_path, 'w') as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, TRANSLATION_INDEX_PATH)
+
+def _load_translations():
+    """Apply lines appended to the file since the last call, by this or other workers; caller holds TRANSLATION_LOCK"""
+    if not TRANSLATION_INDEX["compacted"]:
+        TRANSLATION_INDEX["compacted"] = True
+        try:
+            if os.path.exists(TRANSLATION_INDEX_PATH):
+                _compact_translations()
+        except OSError as e:
+            log_error("translation_index", f"Error compacting translation index: {e}")
+    
+    try:
+        with open(TRANSLATION_INDEX_PATH, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != TRANSLATION_INDEX["inode"]:
+                # First load, or another worker compacted the file: start over
+                TRANSLATION_INDEX.update(entries={}, features={}, profiles={}, inode=inode, offset=0)
+            f.seek(TRANSLATION_INDEX["offset"])
+            data = f.read()
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        log_error("translation_index", f"Error loading translation index: {e}")
+        return
+    
+    # A line still being written by another worker is picked up next time
+    data = data[:data.rfind(b"\n") + 1]
+    TRANSLATION_INDEX["offset"] += len(data)
+    for saved in _read_translation_lines(data):
+        entry = TRANSLATION_INDEX["entries"].get(saved["id"])
+        if entry is None:
+            _index_translation(saved)
+        else:
+            entry.update(saved)
+
+def _save_translation(entry):
+    """Append the current state of one entry; caller holds TRANSLATION_LOCK"""
+    line = (json.dumps(entry) + "\n").encode()
+    with _translation_file_lock(), open(TRANSLATION_INDEX_PATH, 'ab') as f:
+        inode = os.fstat(f.fileno()).st_ino
+        caught_up = f.tell() == TRANSLATION_INDEX["offset"] and inode == TRANSLATION_INDEX["inode"]
+        f.write(line)
+    if caught_up:
+        # Nothing from other workers in between, so there is no need to read our own line back
+        TRANSLATION_INDEX["offset"] += len(line)
+
+def _term_weights(features, vocabulary, idf, unknown_idf):
+    """TF-IDF vector of a query over a profile vocabulary, and the norm including unknown terms"""
+    np = get_backend("numpy")['numpy']
+    vector = np.zeros(len(vocabulary), dtype=np.float32)
+    norm = 0.0
+    for term, count in features.items():
+        column = vocabulary.get(term)
+        weight = count * (idf[column] if column is not None else unknown_idf)
+        if column is not None:
+            vector[column] = weight
+        norm += weight * weight
+    return vector, np.sqrt(norm)
+
+def _profile_matrix(profile):
+    """Build (ids, vocabulary, idf, normalized TF-IDF matrix) for a profile; caller holds TRANSLATION_LOCK"""
+    cached = TRANSLATION_INDEX["profiles"][profile]
+    if cached["matrix"] is not None:
+        return cached["matrix"]
+    np = get_backend("numpy")['numpy']
+    
+    ids = list(cached["ids"])
+    vocabulary = {}
+    for entry_id in ids:
+        for term in TRANSLATION_INDEX["features"][entry_id][0]:
+            vocabulary.setdefault(term, len(vocabulary))
+    
+    total = len(ids)
+    idf = np.ones(len(vocabulary), dtype=np.float32)
+    for term, column in vocabulary.items():
+        idf[column] = np.log((1 + total) / (1 + cached["document_frequency"][term])) + 1
+    
+    matrix = np.zeros((len(ids), len(vocabulary)), dtype=np.float32)
+    for row, entry_id in enumerate(ids):
+        for term, count in TRANSLATION_INDEX["features"][entry_id][0].items():
+            matrix[row, vocabulary[term]] = count * idf[vocabulary[term]]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    
+    cached["matrix"] = (ids, vocabulary, idf, matrix)
+    return cached["matrix"]
+
+def _nearest_translations(normalized, profile):
+    """Entries of a profile with matching parameters, as (score, entry) best first; caller holds TRANSLATION_LOCK"""
+    if profile not in TRANSLATION_INDEX["profiles"] or not backend_available("numpy"):
+        return []
+    np = get_backend("numpy")['numpy']
+    features, parameters = normalized
+    if not features:
+        return []
+    
+    ids, vocabulary, idf, matrix = _profile_matrix(profile)
+    unknown_idf = np.log(1 + len(ids)) + 1
+    vector, norm = _term_weights(features, vocabulary, idf, unknown_idf)
+    if not norm or not len(ids):
+        return []
+    
+    scores = matrix @ (vector / norm)
+    matches = []
+    for row in np.argsort(-scores):
+        if scores[row] < TRANSLATION_MATCH_THRESHOLD:
+            break
+        entry_id = ids[row]
+        if TRANSLATION_INDEX["features"][entry_id][1] == parameters:
+            matches.append((float(scores[row]), TRANSLATION_INDEX["entries"][entry_id]))
+    return matches
+
+def lookup_translation(query, device):
+    """Return a confirmed translation close enough to the query, or None"""
+    normalized = normalize_translation_query(query)
+    with TRANSLATION_LOCK:
+        _load_translations()
+        for score, entry in _nearest_translations(normalized, translation_profile(device)):
+            if entry["status"] == "demoted":
+                continue
+            if entry["status"] != "confirmed":
+                break
+            entry["hits"] += 1
+            increment_counter("network_agent_translation_index_total", result="hit")
+            return {"entry_id": entry["id"], "command": entry["command"], "score": round(score, 3), "matched_query": entry["query"]}
+    
+    increment_counter("network_agent_translation_index_total", result="miss")
+    return None
+
+def _new_translation(query, profile, command, status, normalized):
+    """Create and persist an entry; caller holds TRANSLATION_LOCK"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry = {
+        "id": uuid.uuid4().hex,
+        "query": query,
+        "profile": profile,
+        "command": command,
+        "status": status,
+        "confirmations": 1,
+        "hits": 0,
+        "created": now,
+        "updated": now
+    }
+    _index_translation(entry, normalized)
+    _save_translation(entry)
+    return entry
+
+def record_translation(query, device, command):
+    """Record a model translation as a candidate, or count it as agreement with an existing entry"""
+    if not command.strip():
+        return
+    profile = translation_profile(device)
+    normalized = normalize_translation_query(query)
+    try:
+        with TRANSLATION_LOCK:
+            _load_translations()
+            for _, entry in _nearest_translations(normalized, profile):
+                if entry["command"] != command:
+                    continue
+                entry["confirmations"] += 1
+                # Configuration changes are only ever served after an operator promotes them
+                if (entry["status"] == "candidate" and TRANSLATION_AUTO_CONFIRM
+                        and entry["confirmations"] >= TRANSLATION_AUTO_CONFIRM
+                        and not command.lower().startswith(('configure ', 'config '))):
+                    entry["status"] = "confirmed"
+                    entry["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                _save_translation(entry)
+                return
+            _new_translation(query, profile, command, "candidate", normalized)
+    except OSError as e:
+        log_error("translation_index", f"Error saving translation index: {e}")
+
+def add_translation(query, device, command):
+    """Add an operator-confirmed translation"""
+    normalized = normalize_translation_query(query)
+    with TRANSLATION_LOCK:
+        _load_translations()
+        return dict(_new_translation(query, translation_profile(device), command, "confirmed", normalized))
+
+def set_translation_status(entry_id, status):
+    """Promote or demote an entry; returns the updated entry or None if it doesn't exist"""
+    with TRANSLATION_LOCK:
+        _load_translations()
+        entry = TRANSLATION_INDEX["entries"].get(entry_id)
+        if entry is None:
+            return None
+        entry["status"] = status
+        entry["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _save_translation(entry)
+        return dict(entry)
+
+def list_translations(profile=None, status=None):
+    """Entries of the index, most used first"""
+    with TRANSLATION_LOCK:
+        _load_translations()
+        entries = [
+            dict(entry) for entry in TRANSLATION_INDEX["entries"].values()
+            if (profile is None or entry["profile"] == profile) and (status is None or entry["status"] == status)
+        ]
+    return sorted(entries, key=lambda entry: (-entry["hits"], -entry["confirmations"], entry["created"]))
+
+# Compliance rules. Rules in COMPLIANCE_RULES_PATH are declarative (required or
+# forbidden lines, regexes and block checks, optionally scoped by vendor and OS
+# prefix). They are compiled once per vendor/OS into set lookups for exact lines,
+# a combined prefilter regex for line patterns and header regexes for blocks.
+# Results are cached per device by config hash, so a fleet run only evaluates
+# configs that changed since the last run.
+COMPLIANCE_RULES_PATH = os.getenv("COMPLIANCE_RULES_PATH", "compliance_rules.json")
+COMPLIANCE_RULE_TYPES = ("required_line", "forbidden_line", "required_regex", "forbidden_regex", "block")
+COMPLIANCE_SEVERITIES = ("critical", "warning", "info")
+
+COMPLIANCE_LOCK = threading.Lock()
+COMPLIANCE_STATE = {
+    "rules": [],
+    "mtime": None,
+    "version": 0,
+    "compiled": {},  # (vendor, os) -> compiled matchers
+    "results": {}    # device_id -> {"hash", "version", "source", "findings", "evaluated"}
+}
+
+def _validate_compliance_rule(rule):
+    """Check a rule definition; raises ValueError describing the first problem"""
+    rule_id = rule.get('id')
+    if not rule_id:
+        raise ValueError("Every compliance rule needs an id")
+    if rule.get('type') not in COMPLIANCE_RULE_TYPES:
+        raise ValueError(f"Rule {rule_id}: type must be one of {', '.join(COMPLIANCE_RULE_TYPES)}")
+    if rule.get('severity', 'warning') not in COMPLIANCE_SEVERITIES:
+        raise ValueError(f"Rule {rule_id}: severity must be one of {', '.join(COMPLIANCE_SEVERITIES)}")
+    if rule['type'] == 'block':
+        if not rule.get('parent') or not (rule.get('required') or rule.get('forbidden')):
+            raise ValueError(f"Rule {rule_id}: block rules need a parent and required or forbidden child patterns")
+        if not isinstance(rule.get('parents', []), list):
+            raise ValueError(f"Rule {rule_id}: parents must be a list of header patterns, outermost first")
+        patterns = rule.get('parents', []) + [rule['parent']] + rule.get('required', []) + rule.get('forbidden', [])
+    elif not rule.get('pattern'):
+        raise ValueError(f"Rule {rule_id}: pattern is required")
+    else:
+        patterns = [rule['pattern']] if rule['type'].endswith('_regex') else []
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Rule {rule_id}: invalid regex {pattern!r}: {e}")
+
+def _prefilter_pattern(pattern):
+    """Rewrite leading global flags like (?i) as a scoped group so the pattern can be OR-ed with others"""
+    flags = ''
+    match = re.match(r'\(\?([aiLmsux]+)\)', pattern)
+    while match:
+        flags += match.group(1)
+        pattern = pattern[match.end():]
+        match = re.match(r'\(\?([aiLmsux]+)\)', pattern)
+    return f"(?{flags}:{pattern})" if flags else f"(?:{pattern})"
+
+def _compile_prefilter(patterns):
+    """One combined search for the regex rules; raises ValueError if the patterns cannot be combined"""
+    try:
+        return re.compile('|'.join(_prefilter_pattern(pattern) for pattern in patterns))
+    except re.error as e:
+        raise ValueError(f"Regex rules cannot be combined into one prefilter: {e}")
+
+def load_compliance_rules():
+    """Load the rule file, reloading it when it changes; returns the rule set version"""
+    try:
+        mtime = os.path.getmtime(COMPLIANCE_RULES_PATH)
+    except OSError:
+        raise ValueError(f"Compliance rule file {COMPLIANCE_RULES_PATH} not found")
+    
+    with COMPLIANCE_LOCK:
+        if COMPLIANCE_STATE["mtime"] == mtime:
+            return COMPLIANCE_STATE["version"]
+        
+        with open(COMPLIANCE_RULES_PATH, 'r') as f:
+            rules = json.load(f)
+        for rule in rules:
+            _validate_compliance_rule(rule)
+        # Every device's prefilter is a subset of this one
+        _compile_prefilter([rule['pattern'] for rule in rules if rule['type'] in ('required_regex', 'forbidden_regex')])
+        
+        COMPLIANCE_STATE["rules"] = rules
+        COMPLIANCE_STATE["mtime"] = mtime
+        COMPLIANCE_STATE["version"] += 1
+        COMPLIANCE_STATE["compiled"] = {}
+        return COMPLIANCE_STATE["version"]
+
+def _rule_applies(rule, device):
+    """Check a rule's vendor and OS scope against a device"""
+    if rule.get('vendor') and rule['vendor'].lower() != device.get('vendor', '').lower():
+        return False
+    if rule.get('os') and not device.get('os', '').lower().startswith(rule['os'].lower()):
+        return False
+    return True
+
+def compile_compliance_rules(device):
+    """Compiled matchers for the rules that apply to a device's vendor and OS"""
+    key = (device.get('vendor', ''), device.get('os', ''))
+    with COMPLIANCE_LOCK:
+        compiled = COMPLIANCE_STATE["compiled"].get(key)
+        if compiled is not None:
+            return compiled
+        rules = [rule for rule in COMPLIANCE_STATE["rules"] if _rule_applies(rule, device)]
+    
+    compiled = {"required_lines": {}, "forbidden_lines": {}, "regexes": [], "prefilter": None, "blocks": [], "rules": len(rules)}
+    for rule in rules:
+        if rule['type'] in ('required_line', 'forbidden_line'):
+            compiled[rule['type'] + 's'][rule['pattern'].strip()] = rule
+        elif rule['type'] in ('required_regex', 'forbidden_regex'):
+            compiled["regexes"].append((rule, re.compile(rule['pattern'])))
+        else:
+            compiled["blocks"].append((
+                rule,
+                [re.compile(pattern) for pattern in rule.get('parents', [])] + [re.compile(rule['parent'])],
+                [re.compile(pattern) for pattern in rule.get('required', [])],
+                [re.compile(pattern) for pattern in rule.get('forbidden', [])]
+            ))
+    # Most lines match no pattern at all; one combined search rejects them cheaply
+    if compiled["regexes"]:
+        compiled["prefilter"] = _compile_prefilter([rule['pattern'] for rule, _ in compiled["regexes"]])
+    
+    with COMPLIANCE_LOCK:
+        COMPLIANCE_STATE["compiled"][key] = compiled
+    return compiled
+
+def _compliance_finding(device_id, rule, detail=None):
+    message = f"{rule.get('message', rule['id'])} ({detail})" if detail else rule.get('message', rule['id'])
+    return {"device": device_id, "severity": rule.get('severity', 'warning'), "message": message, "rule": rule['id']}
+
+def evaluate_compliance(device_id, config):
+    """Evaluate a configuration against the compiled rules for its device"""
+    compiled = compile_compliance_rules(NETWORK_DEVICES[device_id])
+    findings = []
+    first_seen = {}
+    regex_matches = {}
+    
+    for number, line in enumerate(config.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        first_seen.setdefault(stripped, number)
+        if compiled["prefilter"] is None or not compiled["prefilter"].search(line):
+            continue
+        for rule, regex in compiled["regexes"]:
+            if rule['id'] not in regex_matches and regex.search(line):
+                regex_matches[rule['id']] = (number, stripped)
+    
+    for line, rule in compiled["required_lines"].items():
+        if line not in first_seen:
+            findings.append(_compliance_finding(device_id, rule))
+    for line, rule in compiled["forbidden_lines"].items():
+        if line in first_seen:
+            findings.append(_compliance_finding(device_id, rule, f"line {first_seen[line]}: {line}"))
+    for rule, _ in compiled["regexes"]:
+        match = regex_matches.get(rule['id'])
+        if rule['type'] == 'required_regex' and match is None:
+            findings.append(_compliance_finding(device_id, rule))
+        elif rule['type'] == 'forbidden_regex' and match is not None:
+            findings.append(_compliance_finding(device_id, rule, f"line {match[0]}: {match[1]}"))
+    
+    if compiled["blocks"]:
+        tree = parse_config_tree(config)
+        for rule, path, required, forbidden in compiled["blocks"]:
+            # Descend level by level: each pattern selects among the children of the blocks above
+            blocks = [(block, block['header'].strip()) for block in tree if path[0].search(block['header'])]
+            for pattern in path[1:]:
+                blocks = [
+                    (child, f"{name} > {child['header'].strip()}")
+                    for block, name in blocks for child in block['children'] if pattern.search(child['header'])
+                ]
+            for block, name in blocks:
+                for pattern in required:
+                    if not any(pattern.search(child) for child in block['lines']):
+                        findings.append(_compliance_finding(device_id, rule, f"'{name}' at line {block['line']} lacks {pattern.pattern}"))
+                for pattern in forbidden:
+                    for child in block['lines']:
+                        if pattern.search(child):
+                            findings.append(_compliance_finding(device_id, rule, f"'{name}' at line {block['line']}: {child.strip()}"))
+                            break
+            # A block that must contain something must also exist
+            if not blocks and required:
+                findings.append(_compliance_finding(device_id, rule, f"no block matching {' > '.join(pattern.pattern for pattern in path)}"))
+    
+    return findings
+
+def latest_backups(directory="backups"):
+    """Path of the newest backup of each device"""
+    latest = {}
+    if not os.path.isdir(directory):
+        return latest
+    for entry in os.scandir(directory):
+        match = BACKUP_FILENAME_PATTERN.match(entry.name)
+        if match and entry.is_file():
+            current = latest.get(match.group('device'))
+            if current is None or current[0] < match.group('time'):
+                latest[match.group('device')] = (match.group('time'), entry.path)
+    return {device_id: path for device_id, (_, path) in latest.items()}
+
+def fetch_running_config(device_id):
+    """Pull the running configuration of a device (simulated in simulation mode)"""
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("napalm"):
+        return simulate_command_execution(device_id, "show running-config")
+    
+    # Use NAPALM to get the device configuration
+    with device_circuit(device_id), napalm_session(device_id) as device_conn:
+        return device_conn.get_config().get('running', '')
+
+def _cached_compliance(device_id, config_hash, version):
+    """Cached findings for a device if neither its config nor the rules changed"""
+    with COMPLIANCE_LOCK:
+        cached = COMPLIANCE_STATE["results"].get(device_id)
+    if cached and cached["hash"] == config_hash and cached["version"] == version:
+        return cached
+    return None
+
+def check_device_compliance(device_id, config, source, version):
+    """Evaluate one device's config unless its hash is unchanged; returns the cached result record"""
+    config_hash = hashlib.sha256(config.encode('utf-8', errors='replace')).hexdigest()
+    cached = _cached_compliance(device_id, config_hash, version)
+    if cached is not None:
+        increment_counter("network_agent_compliance_evaluations_total", result="cached")
+        return dict(cached, status="cached")
+    
+    with track_stage("evaluate_compliance", device=device_id):
+        findings = evaluate_compliance(device_id, config)
+    increment_counter("network_agent_compliance_evaluations_total", result="evaluated")
+    
+    result = {
+        "hash": config_hash,
+        "version": version,
+        "source": source,
+        "findings": findings,
+        "evaluated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    with COMPLIANCE_LOCK:
+        COMPLIANCE_STATE["results"][device_id] = result
+    return dict(result, status="evaluated")
+
+def run_compliance_checks(device_ids=None, source="backup", priority="batch"):
+    """Check devices in parallel against stored backups or live configs; returns (findings, per-device status)"""
+    version = load_compliance_rules()
+    device_ids = list(device_ids or NETWORK_DEVICES.keys())
+    backups = latest_backups() if source == "backup" else {}
+    
+    def check_backup(device_id):
+        path = backups.get(device_id)
+        if path is None:
+            return {"status": "no_backup"}
+        with open(path, 'r', errors='replace') as f:
+            return check_device_compliance(device_id, f.read(), path, version)
+    
+    def check_live(device_id):
+        try:
+            config = fetch_running_config(device_id)
+        except DeviceUnreachableError as e:
+            return {"status": "unreachable", "error": str(e)}
+        except Exception as e:
+            log_error("compliance", f"Error pulling configuration: {e}", device_id)
+            return {"status": "error", "error": str(e)}
+        return check_device_compliance(device_id, config, "live", version)
+    
+    with track_stage("compliance_checks", devices=len(device_ids), source=source):
+        if source == "live":
+            futures = [submit_device_task(device_id, priority, check_live, device_id) for device_id in device_ids]
+            results = [future.result() for future in futures]
+        else:
+            with ThreadPoolExecutor(max_workers=min(16, max(1, len(device_ids)))) as executor:
+                results = list(executor.map(check_backup, device_ids))
+    
+    findings = []
+    devices = {}
+    for device_id, result in zip(device_ids, results):
+        findings.extend(result.get("findings", []))
+        devices[device_id] = {key: value for key, value in result.items() if key not in ("findings", "version")}
+        devices[device_id]["findings"] = len(result.get("findings", []))
+    
+    severity_order = {severity: i for i, severity in enumerate(COMPLIANCE_SEVERITIES)}
+    findings.sort(key=lambda finding: (severity_order.get(finding["severity"], len(severity_order)), finding["device"]))
+    return findings, devices
+
+# Circuit breakers for device I/O. After BREAKER_FAILURE_THRESHOLD consecutive
+# connection failures a device's breaker opens and calls fail fast with
+# DeviceUnreachableError instead of waiting for another connect timeout. Once the
+# backoff expires a single probe is let through (half-open): success closes the
+# breaker, failure reopens it with the backoff doubled up to BREAKER_MAX_BACKOFF.
+# Discovery uses the same breakers keyed by IP, as a negative cache of dead hosts.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", "30"))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "900"))
+BREAKER_PROBE_TIMEOUT = 120
+DISCOVERY_FAILURE_THRESHOLD = int(os.getenv("DISCOVERY_FAILURE_THRESHOLD", "1"))
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ECONNREFUSED, errno.ETIMEDOUT, errno.EHOSTDOWN}
+
+BREAKERS_LOCK = threading.Lock()
+# key (device ID or discovered IP) -> breaker state
+CIRCUIT_BREAKERS = {}
+# Breakers held by the current thread, so nested device calls don't probe twice
+BREAKER_LOCAL = threading.local()
+
+class DeviceUnreachableError(Exception):
+    """Raised when a device cannot be reached or its circuit breaker is open"""
+
+def is_unreachable_error(error):
+    """Check whether an exception raised while connecting means the device could not be reached at all.
+    
+    Only meaningful for the connect phase: a timeout on an established session is a slow
+    command, not a dead device.
+    """
+    if isinstance(error, (DeviceUnreachableError, TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, OSError) and error.errno in UNREACHABLE_ERRNOS:
+        return True
+    # Library exceptions: NetmikoTimeoutException, NAPALM ConnectionException, NoValidConnectionsError
+    name = type(error).__name__.lower()
+    return any(marker in name for marker in ("netmikotimeout", "unreachable", "connectionexception", "novalidconnections"))
+
+def _new_breaker(threshold):
+    return {
+        "state": "closed",
+        "failures": 0,
+        "threshold": threshold,
+        "backoff": 0,
+        "retry_at": None,
+        "probe_started": None,
+        "trips": 0,
+        "last_error": None,
+        "last_failure": None,
+        "last_success": None
+    }
+
+def _set_breaker_state(key, breaker, state):
+    """Change state and count the transition; caller holds BREAKERS_LOCK"""
+    if breaker["state"] != state:
+        breaker["state"] = state
+        increment_counter("network_agent_circuit_transitions_total", state=state)
+        if STRUCTURED_LOGS:
+            emit_log("circuit_breaker", key=key, state=state, failures=breaker["failures"])
+        else:
+            print(f"Circuit breaker for {key} is now {state}")
+
+def acquire_circuit(key, threshold=None):
+    """Let a call through, or raise DeviceUnreachableError while the breaker is open"""
+    now = time.time()
+    with BREAKERS_LOCK:
+        breaker = CIRCUIT_BREAKERS.setdefault(key, _new_breaker(threshold or BREAKER_FAILURE_THRESHOLD))
+        if breaker["state"] == "closed":
+            return
+        
+        probe_running = breaker["probe_started"] is not None and now - breaker["probe_started"] < BREAKER_PROBE_TIMEOUT
+        if breaker["state"] == "open" and now >= breaker["retry_at"] or breaker["state"] == "half_open" and not probe_running:
+            # Let one probe through
+            _set_breaker_state(key, breaker, "half_open")
+            breaker["probe_started"] = now
+            return
+        
+        retry_in = max(0, int(breaker["retry_at"] - now))
+        last_error = breaker["last_error"]
+    
+    increment_counter("network_agent_circuit_rejections_total")
+    raise DeviceUnreachableError(f"Device {key} is unreachable (circuit open after: {last_error}; next probe in {retry_in}s)")
+
+def record_circuit_success(key):
+    """The device answered: close its breaker"""
+    with BREAKERS_LOCK:
+        breaker = CIRCUIT_BREAKERS.get(key)
+        if breaker is None:
+            return
+        breaker["failures"] = 0
+        breaker["backoff"] = 0
+        breaker["retry_at"] = None
+        breaker["probe_started"] = None
+        breaker["last_success"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _set_breaker_state(key, breaker, "closed")
+
+def record_circuit_failure(key, error):
+    """The device could not be reached: count the failure and open the breaker at the threshold"""
+    with BREAKERS_LOCK:
+        breaker = CIRCUIT_BREAKERS.setdefault(key, _new_breaker(BREAKER_FAILURE_THRESHOLD))
+        breaker["failures"] += 1
+        breaker["last_error"] = str(error) or type(error).__name__
+        breaker["last_failure"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        # Back off further only when the breaker trips or its probe fails; calls that
+        # were already in flight when it opened must not stretch the backoff again
+        if breaker["state"] == "open" or breaker["state"] == "closed" and breaker["failures"] < breaker["threshold"]:
+            return
+        if breaker["state"] == "closed":
+            breaker["trips"] += 1
+        breaker["probe_started"] = None
+        # Exponential backoff with jitter so probes of many dead devices don't line up
+        breaker["backoff"] = min(BREAKER_MAX_BACKOFF, breaker["backoff"] * 2 if breaker["backoff"] else BREAKER_BASE_BACKOFF)
+        breaker["retry_at"] = time.time() + breaker["backoff"] * random.uniform(0.9, 1.1)
+        _set_breaker_state(key, breaker, "open")
+
+@contextmanager
+def device_connect(key):
+    """Wrap opening a session: unreachable errors count against the key's breaker and are raised as DeviceUnreachableError"""
+    try:
+        yield
+    except DeviceUnreachableError:
+        raise
+    except Exception as e:
+        if not is_unreachable_error(e):
+            raise
+        record_circuit_failure(key, e)
+        raise DeviceUnreachableError(f"Device {key} is unreachable: {e}") from e
+
+@contextmanager
+def device_circuit(key, threshold=None):
+    """Guard device I/O with the key's breaker; only failures to connect (see device_connect) open it"""
+    held = getattr(BREAKER_LOCAL, "held", None)
+    if held is None:
+        held = BREAKER_LOCAL.held = set()
+    if key in held:
+        yield
+        return
+    
+    acquire_circuit(key, threshold)
+    held.add(key)
+    try:
+        yield
+    except DeviceUnreachableError:
+        # Already counted by device_connect
+        raise
+    except Exception:
+        # The device answered, even if the command failed
+        record_circuit_success(key)
+        raise
+    else:
+        record_circuit_success(key)
+    finally:
+        held.discard(key)
+
+def get_circuit_breakers():
+    """Breaker state of every device and discovered host that has been tried"""
+    now = time.time()
+    with BREAKERS_LOCK:
+        breakers = {}
+        for key, breaker in CIRCUIT_BREAKERS.items():
+            state = {name: value for name, value in breaker.items() if name not in ("retry_at", "probe_started")}
+            state["retry_in"] = max(0, round(breaker["retry_at"] - now, 1)) if breaker["retry_at"] else None
+            state["managed"] = key in NETWORK_DEVICES
+            breakers[key] = state
+    return breakers
+
+def reset_circuit_breaker(key):
+    """Close a breaker by hand, e.g. after a device is repaired; returns False if it doesn't exist"""
+    with BREAKERS_LOCK:
+        if key not in CIRCUIT_BREAKERS:
+            return False
+    record_circuit_success(key)
+    return True
+
+# Streaming configuration transfer. Stored backups are addressed by ID (the
+# backup file name without .cfg) and served with send_file, which streams from
+# disk and handles Range/If-Range for resumed downloads. Compressed copies are
+# written once next to the backup and served the same way, so ranges also work
+# on the compressed representation. Uploads are appended to a part file chunk by
+# chunk (optionally resumed with Content-Range) and decompressed into a backup
+# file as a stream, so memory use doesn't grow with the config size.
+BACKUP_DIR = "backups"
+TRANSFER_CHUNK_SIZE = 65536
+CONFIG_UPLOAD_MAX_BYTES = int(os.getenv("CONFIG_UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+CONFIG_UPLOAD_TTL = 86400
+TRANSFER_ENCODINGS = {"gzip": ".gz", "zstd": ".zst"}
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+UPLOADS_LOCK = threading.Lock()
+# upload_id -> {"device", "encoding", "path", "offset", "total", "created", "lock"}
+CONFIG_UPLOADS = {}
+
+def list_backups(device_id=None):
+    """Stored backups, newest first"""
+    backups = []
+    if not os.path.isdir(BACKUP_DIR):
+        return backups
+    for entry in os.scandir(BACKUP_DIR):
+        match = BACKUP_FILENAME_PATTERN.match(entry.name)
+        if not match or not entry.is_file() or (device_id and match.group('device') != device_id):
+            continue
+        backups.append({
+            "backup_id": entry.name[:-len('.cfg')],
+            "device": match.group('device'),
+            "time": match.group('time'),
+            "size": entry.stat().st_size
+        })
+    return sorted(backups, key=lambda backup: backup["time"], reverse=True)
+
+def get_backup_path(backup_id):
+    """Path of a stored backup, or None if the ID is invalid or unknown"""
+    filename = f"{backup_id}.cfg"
+    if os.path.basename(filename) != filename or not BACKUP_FILENAME_PATTERN.match(filename):
+        return None
+    path = os.path.join(BACKUP_DIR, filename)
+    return path if os.path.isfile(path) else None
+
+def backup_device(backup_id):
+    return BACKUP_FILENAME_PATTERN.match(f"{backup_id}.cfg").group('device')
+
+def choose_transfer_encoding(accept_encodings):
+    """Best content encoding the client accepts and the server can produce"""
+    offered = (["zstd"] if backend_available("zstandard") else []) + ["gzip", "identity"]
+    return accept_encodings.best_match(offered, default="identity") or "identity"
+
+def get_compressed_backup(path, encoding):
+    """Path of a compressed copy of a backup, written on first request"""
+    compressed_path = path + TRANSFER_ENCODINGS[encoding]
+    if os.path.exists(compressed_path) and os.path.getmtime(compressed_path) >= os.path.getmtime(path):
+        return compressed_path
+    
+    temp_path = f"{compressed_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with track_stage("compress_backup", encoding=encoding):
+        with open(path, 'rb') as source:
+            if encoding == "gzip":
+                with gzip.open(temp_path, 'wb', compresslevel=6) as target:
+                    shutil.copyfileobj(source, target, TRANSFER_CHUNK_SIZE)
+            else:
+                zstandard = get_backend("zstandard")['zstandard']
+                with open(temp_path, 'wb') as target:
+                    zstandard.ZstdCompressor().copy_stream(source, target, read_size=TRANSFER_CHUNK_SIZE)
+    os.replace(temp_path, compressed_path)
+    return compressed_path
+
+def _evict_config_uploads():
+    """Drop uploads that were never completed; caller holds UPLOADS_LOCK"""
+    now = time.time()
+    for upload_id in [u for u, upload in CONFIG_UPLOADS.items() if now - upload["created"] > CONFIG_UPLOAD_TTL]:
+        upload = CONFIG_UPLOADS.pop(upload_id)
+        if os.path.exists(upload["path"]):
+            os.remove(upload["path"])
+
+def create_config_upload(device_id, encoding, total=None):
+    """Start a (resumable) upload; returns its ID"""
+    os.makedirs(os.path.join(BACKUP_DIR, "uploads"), exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    path = os.path.join(BACKUP_DIR, "uploads", f"{upload_id}.part")
+    open(path, 'wb').close()
+    with UPLOADS_LOCK:
+        _evict_config_uploads()
+        CONFIG_UPLOADS[upload_id] = {
+            "device": device_id,
+            "encoding": encoding,
+            "path": path,
+            "offset": 0,
+            "total": total,
+            "created": time.time(),
+            "lock": threading.Lock()
+        }
+    return upload_id
+
+def get_config_upload(upload_id):
+    with UPLOADS_LOCK:
+        return CONFIG_UPLOADS.get(upload_id)
+
+def append_config_upload(upload, stream, start):
+    """Append a request body to the part file at start; returns the new offset"""
+    with upload["lock"]:
+        if start != upload["offset"]:
+            raise ValueError(f"Upload is at offset {upload['offset']}, not {start}")
+        with open(upload["path"], 'ab') as target:
+            while True:
+                chunk = stream.read(TRANSFER_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if upload["offset"] + len(chunk) > CONFIG_UPLOAD_MAX_BYTES:
+                    raise ValueError(f"Upload exceeds {CONFIG_UPLOAD_MAX_BYTES} bytes")
+                target.write(chunk)
+                upload["offset"] += len(chunk)
+        return upload["offset"]
+
+class ConfigTooLargeError(Exception):
+    """Raised when an upload decompresses to more than CONFIG_UPLOAD_MAX_BYTES"""
+
+class LimitedWriter:
+    """File wrapper that refuses writes past a byte limit, so a small compressed upload cannot fill the disk"""
+    def __init__(self, target, limit):
+        self.target = target
+        self.limit = limit
+        self.written = 0
+    
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.limit:
+            raise ConfigTooLargeError(f"Configuration exceeds {self.limit} bytes once decompressed")
+        return self.target.write(data)
+
+def finish_config_upload(upload_id):
+    """Decompress a complete upload into a new backup file; returns the backup ID"""
+    with UPLOADS_LOCK:
+        upload = CONFIG_UPLOADS.pop(upload_id)
+    
+    backup_id = f"{upload['device']}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    path = os.path.join(BACKUP_DIR, f"{backup_id}.cfg")
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with track_stage("store_uploaded_backup", device=upload["device"], encoding=upload["encoding"]):
+            with open(temp_path, 'wb') as temp_file:
+                target = LimitedWriter(temp_file, CONFIG_UPLOAD_MAX_BYTES)
+                if upload["encoding"] == "gzip":
+                    with gzip.open(upload["path"], 'rb') as source:
+                        shutil.copyfileobj(source, target, TRANSFER_CHUNK_SIZE)
+                elif upload["encoding"] == "zstd":
+                    zstandard = get_backend("zstandard")['zstandard']
+                    with open(upload["path"], 'rb') as source:
+                        zstandard.ZstdDecompressor().copy_stream(source, target, write_size=TRANSFER_CHUNK_SIZE)
+                else:
+                    with open(upload["path"], 'rb') as source:
+                        shutil.copyfileobj(source, target, TRANSFER_CHUNK_SIZE)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        os.remove(upload["path"])
+    
+    # Keep the config search index current
+    index_config_backup(path)
+    return backup_id
+
+def describe_config_file(path):
+    """Count lines and hash a config file without loading it; returns (lines, sha256)"""
+    lines = 0
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(TRANSFER_CHUNK_SIZE), b''):
+            lines += chunk.count(b'\n')
+            digest.update(chunk)
+    return lines + 1, digest.hexdigest()
+
+@app.route('/')
+def index():
+    return render_template('index.html', devices=NETWORK_DEVICES)
+
+@app.route('/api/devices')
+def get_devices():
+    return jsonify(NETWORK_DEVICES)
+
+@app.route('/api/execute', methods=['POST'])
+def execute_command():
+    data = request.json
+    query = data.get('query', '')
+    priority = get_request_priority(data, "interactive")
+    
+    if priority is None:
+        return jsonify({"error": f"Priority must be one of: {', '.join(SCHEDULER_PRIORITIES)}"}), 400
+    
+    # Process the natural language query
+    response = process_natural_language(query, priority)
+    audit_event(
+        "execute",
+        response["device_id"],
+        response["interpreted_command"],
+        "error" if str(response["result"]).startswith("Error executing command") else "ok",
+        get_request_user(),
+        query=query
+    )
+    
+    # Check for anomalies using AI
+    with track_stage("analyze_network_anomalies"):
+        anomalies = analyze_network_anomalies(NETWORK_DEVICES)
+    if anomalies:
+        response["anomalies"] = anomalies
+    
+    return jsonify(response)
+
+@app.route('/api/execute_batch', methods=['POST'])
+def execute_batch():
+    """Endpoint to run several read commands on one device over a single session"""
+    data = request.json
+    device_id = data.get('device_id')
+    commands = data.get('commands')
+    priority = get_request_priority(data, "interactive")
+    
+    if not isinstance(commands, list) or not all(isinstance(command, str) for command in commands):
+        return jsonify({"error": "Commands must be a list of strings"}), 400
+    commands = [command for command in commands if command.strip()]
+    
+    if not device_id or not commands:
+        return jsonify({"error": "Device ID and a list of commands are required"}), 400
+    
+    if priority is None:
+        return jsonify({"error": f"Priority must be one of: {', '.join(SCHEDULER_PRIORITIES)}"}), 400
+    
+    if device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    outputs = run_device_task(device_id, priority, execute_device_commands, device_id, commands)
+    audit_event("execute_batch", device_id, "\n".join(commands), user=get_request_user(), commands=len(commands))
+    
+    results = []
+    for command, output in zip(commands, outputs):
+        output, output_pages = paginate_large_output(device_id, command, output)
+        result = {"command": command, "output": output}
+        if output_pages:
+            result["pages"] = output_pages
+        results.append(result)
+    
+    return jsonify({
+        "device_id": device_id,
+        "results": results,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+@app.route('/api/fleet_execute', methods=['POST'])
+def fleet_execute():
+    """Endpoint to run a read command on many devices concurrently"""
+    data = request.json
+    command = data.get('command', '')
+    device_ids = data.get('devices') or list(NETWORK_DEVICES.keys())
+    priority = get_request_priority(data, "batch")
+    
+    if not command:
+        return jsonify({"error": "Command is required"}), 400
+    
+    if priority is None:
+        return jsonify({"error": f"Priority must be one of: {', '.join(SCHEDULER_PRIORITIES)}"}), 400
+    
+    if command.lower().startswith('configure ') or command.lower().startswith('config '):
+        return jsonify({"error": "Fleet execution only supports read commands"}), 400
+    
+    unknown = [device_id for device_id in device_ids if device_id not in NETWORK_DEVICES]
+    if unknown:
+        return jsonify({"error": f"Devices not found: {', '.join(unknown)}"}), 404
+    
+    results = execute_fleet_command(device_ids, command, priority)
+    
+    user = get_request_user()
+    pages = {}
+    for device_id, output in results.items():
+        audit_event("fleet_execute", device_id, command, "error" if str(output).startswith("Error executing command") else "ok", user)
+        # Large outputs are returned as their first page, like single-device results
+        results[device_id], output_pages = paginate_large_output(device_id, command, output)
+        if output_pages:
+            pages[device_id] = output_pages
+    
+    return jsonify({
+        "command": command,
+        "results": results,
+        "pages": pages,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+@app.route('/api/output/<output_id>', methods=['GET'])
+def get_output_page(output_id):
+    """Endpoint to fetch one page of a large command output"""
+    try:
+        page = int(request.args.get('page', 0))
+    except ValueError:
+        return jsonify({"error": "Page must be an integer"}), 400
+    
+    entry = get_large_output(output_id)
+    if entry is None:
+        return jsonify({"error": f"Output {output_id} not found or expired"}), 404
+    
+    if not 0 <= page < len(entry['chunks']):
+        return jsonify({"error": f"Page {page} out of range (0-{len(entry['chunks']) - 1})"}), 404
+    
+    content = _read_entry_chunk(entry, page)
+    if content is None:
+        return jsonify({"error": f"Output {output_id} not found or expired"}), 404
+    
+    return jsonify({
+        "output_id": output_id,
+        "device_id": entry['device'],
+        "command": entry['command'],
+        "page": page,
+        "pages": len(entry['chunks']),
+        "first_line": entry['chunks'][page][2],
+        "size": entry['size'],
+        "content": content
+    })
+
+@app.route('/api/output/<output_id>/process', methods=['POST'])
+def process_output(output_id):
+    """Endpoint to filter, parse or summarize a large output chunk by chunk"""
+    data = request.json or {}
+    operation = data.get('operation', 'filter')
+    
+    if operation not in ('filter', 'parse', 'summarize'):
+        return jsonify({"error": "Operation must be one of filter, parse, summarize"}), 400
+    
+    try:
+        result = process_large_output(output_id, operation, data.get('pattern'))
+    except (ValueError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if result is None:
+        return jsonify({"error": f"Output {output_id} not found or expired"}), 404
+    
+    result["output_id"] = output_id
+    return jsonify(result)
+
+@app.route('/api/translations', methods=['GET'])
+def get_translations():
+    """Endpoint to list entries of the translation index"""
+    device_id = request.args.get('device_id')
+    status = request.args.get('status')
+    
+    if device_id and device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    if status and status not in TRANSLATION_STATUSES:
+        return jsonify({"error": f"Status must be one of: {', '.join(TRANSLATION_STATUSES)}"}), 400
+    
+    profile = translation_profile(NETWORK_DEVICES[device_id]) if device_id else None
+    return jsonify({"translations": list_translations(profile, status)})
+
+@app.route('/api/translations', methods=['POST'])
+def create_translation():
+    """Endpoint to add a confirmed query-to-command translation"""
+    data = request.json
+    query = data.get('query', '').strip()
+    device_id = data.get('device_id')
+    command = data.get('command', '').strip()
+    
+    if not query or not device_id or not command:
+        return jsonify({"error": "Query, device ID and command are required"}), 400
+    
+    if device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    entry = add_translation(query, NETWORK_DEVICES[device_id], command)
+    audit_event("translation_add", device_id, command, user=get_request_user(), query=query, entry_id=entry["id"])
+    
+    return jsonify(entry)
+
+@app.route('/api/translations/<entry_id>/<action>', methods=['POST'])
+def update_translation(entry_id, action):
+    """Endpoint to promote an entry so it is served, or demote it so it never is"""
+    statuses = {"promote": "confirmed", "demote": "demoted"}
+    if action not in statuses:
+        return jsonify({"error": "Action must be promote or demote"}), 400
+    
+    entry = set_translation_status(entry_id, statuses[action])
+    if entry is None:
+        return jsonify({"error": f"Translation {entry_id} not found"}), 404
+    
+    audit_event(f"translation_{action}", command=entry["command"], user=get_request_user(), entry_id=entry_id, profile=entry["profile"])
+    
+    return jsonify(entry)
+
+@app.route('/api/explain', methods=['POST'])
+def explain_command():
+    """Endpoint to explain what a command does in plain English"""
+    data = request.json
+    command = data.get('command', '')
+    device_id = data.get('device_id', list(NETWORK_DEVICES.keys())[0])
+    device = NETWORK_DEVICES[device_id]
+    
+    try:
+        system_prompt = f"""
+        You are a network command explainer for {device['vendor']} {device['type']} devices.
+        Explain what the following command does in simple terms that a junior network engineer would understand.
+        Be concise but thorough.
+        """
+        
+        response = create_chat_completion(
+            "explain_command",
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": command}
+            ],
+            max_tokens=300,
+            temperature=0.5
+        )
+        
+        explanation = response.choices[0].message.content.strip()
+        return jsonify({"explanation": explanation})
+    except Exception as e:
+        log_error("explain_command", f"Error in command explanation: {e}")
+        return jsonify({"explanation": f"This command appears to be for {device['type']} configuration or monitoring."})
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest_commands():
+    """Endpoint to suggest common commands for a device"""
+    device_id = request.args.get('device_id', list(NETWORK_DEVICES.keys())[0])
+    device = NETWORK_DEVICES[device_id]
+    
+    try:
+        system_prompt = f"""
+        You are a network command assistant for {device['vendor']} {device['type']} devices running {device['os']}.
+        Suggest 5 common and useful commands that network engineers might want to run on this device.
+        Return the suggestions as a JSON array of objects with 'command' and 'description' fields.
+        """
+        
+        response = create_chat_completion(
+            "suggest_commands",
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Suggest commands for {device['vendor']} {device['model']}"}
+            ],
+            max_tokens=500,
+            temperature=0.7
+        )
+        
+        suggestions = json.loads(response.choices[0].message.content.strip())
+        return jsonify({"suggestions": suggestions})
+    except Exception as e:
+        log_error("suggest_commands", f"Error in command suggestions: {e}")
+        # Fallback suggestions
+        fallback_suggestions = [
+            {"command": "show interfaces", "description": "Display interface status and statistics"},
+            {"command": "show running-config", "description": "Display the current configuration"},
+            {"command": "show ip route", "description": "Display the routing table"},
+            {"command": "show version", "description": "Display device hardware and software information"},
+            {"command": "show log", "description": "Display system logs"}
+        ]
+        return jsonify({"suggestions": fallback_suggestions})
+
+@app.route('/api/discover', methods=['POST'])
+def discover_devices():
+    """Endpoint to discover network devices in a subnet"""
+    data = request.json
+    subnet = data.get('subnet', '192.168.1.0/24')
+    user = get_request_user()
+    audit_event("discovery", command=f"discover {subnet}", status="started", user=user)
+    
+    # Start discovery in a background thread to avoid blocking
+    def run_discovery():
+        global NETWORK_DEVICES
+        with track_stage("discover_devices", subnet=subnet):
+            discovered = discover_network_devices(subnet)
+        
+        # Update the global device list with new discoveries
+        for device in discovered:
+            if 'ip' in device and device['ip'] not in [d['ip'] for d in NETWORK_DEVICES.values()]:
+                device_id = f"device_{len(NETWORK_DEVICES) + 1}"
+                NETWORK_DEVICES[device_id] = device
+        
+        audit_event("discovery", command=f"discover {subnet}", status="completed", user=user, discovered=len(discovered))
+    
+    threading.Thread(target=run_discovery).start()
+    
+    return jsonify({"message": f"Discovery started for subnet {subnet}. Check back soon for results."})
+
+@app.route('/api/topology', methods=['GET'])
+def get_topology():
+    """Endpoint to get the network topology graph built from LLDP neighbors"""
+    if request.args.get('refresh', 'false').lower() == 'true' or not TOPOLOGY_REPORTED:
+        refresh_topology()
+    
+    return jsonify(get_topology_snapshot())
+
+@app.route('/api/topology/refresh', methods=['POST'])
+def refresh_topology_endpoint():
+    """Endpoint to re-collect neighbors for one device, or all devices if none is given"""
+    data = request.json or {}
+    device_id = data.get('device_id')
+    
+    if device_id and device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    changed = refresh_topology([device_id] if device_id else None, get_request_priority(data, "background") or "background")
+    
+    return jsonify({
+        "message": "Topology refreshed",
+        "changed_devices": changed,
+        "version": TOPOLOGY_STATE["version"]
+    })
+
+@app.route('/api/topology/path', methods=['GET'])
+def get_topology_path():
+    """Endpoint to find the shortest path between two nodes"""
+    source = request.args.get('source')
+    target = request.args.get('target')
+    
+    if not source or not target:
+        return jsonify({"error": "Source and target are required"}), 400
+    
+    if not TOPOLOGY_REPORTED:
+        refresh_topology()
+    
+    path = find_topology_path(source, target)
+    if path is None:
+        return jsonify({"error": f"No path found between {source} and {target}"}), 404
+    
+    return jsonify({"source": source, "target": target, "path": path, "hops": len(path) - 1})
+
+@app.route('/api/topology/blast_radius', methods=['GET'])
+def get_topology_blast_radius():
+    """Endpoint to list the nodes cut off if a device fails"""
+    device_id = request.args.get('device_id')
+    
+    if not device_id:
+        return jsonify({"error": "Device ID is required"}), 400
+    
+    if not TOPOLOGY_REPORTED:
+        refresh_topology()
+    
+    result = get_blast_radius(device_id, request.args.get('root'))
+    if result is None:
+        return jsonify({"error": f"Device {device_id} not found in topology"}), 404
+    
+    return jsonify(result)
+
+@app.route('/api/backup', methods=['POST'])
+def backup_config():
     """Endpoint to backup device configurations"""
     data = request.json
     device_id = data.get('device_id')
+    priority = get_request_priority(data, "batch")
+    include_config = data.get('include_config', True)
     
     if not device_id:
         return jsonify({"error": "Device ID is required"}), 400
     
+    if priority is None:
+        return jsonify({"error": f"Priority must be one of: {', '.join(SCHEDULER_PRIORITIES)}"}), 400
+    
     if device_id not in NETWORK_DEVICES:
         return jsonify({"error": f"Device {device_id} not found"}), 404
     
-    device = NETWORK_DEVICES[device_id]
-    
     # If we're in simulation mode, return a simulated backup
-    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not NAPALM_AVAILABLE:
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("napalm"):
         backup_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        audit_event("backup", device_id, "show running-config", user=get_request_user(), simulated=True)
         return jsonify({
             "message": f"Configuration backup completed for {device_id}",
             "filename": f"{device_id}_{backup_time}.cfg",
@@ -681,93 +3718,276 @@ def backup_config():
         })
     
     try:
-        # Use NAPALM to get the device configuration
-        driver = get_network_driver(device['device_type'].replace('_', ''))
-        with driver(
-            hostname=device['ip'],
-            username=device['username'],
-            password=device['password'],
-            optional_args={'secret': device['secret'] if device['secret'] else ''}
-        ) as device_conn:
-            # Get the configuration
-            config = device_conn.get_config()
-            running_config = config.get('running', '')
-            
-            # Save to file
-            backup_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = f"backups/{device_id}_{backup_time}.cfg"
-            
-            # Ensure backups directory exists
-            os.makedirs("backups", exist_ok=True)
-            
-            with open(filename, 'w') as f:
-                f.write(running_config)
-            
-            return jsonify({
-                "message": f"Configuration backup completed for {device_id}",
-                "filename": filename,
-                "config": running_config
-            })
+        running_config = run_device_task(device_id, priority, fetch_running_config, device_id)
+        
+        # Save to file
+        backup_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filename = f"backups/{device_id}_{backup_time}.cfg"
+        
+        # Ensure backups directory exists
+        os.makedirs("backups", exist_ok=True)
+        
+        with open(filename, 'w') as f:
+            f.write(running_config)
+        
+        # Keep the config search index current
+        index_config_backup(filename)
+        audit_event("backup", device_id, "show running-config", user=get_request_user(), filename=filename)
+        
+        backup_id = f"{device_id}_{backup_time}"
+        response = {
+            "message": f"Configuration backup completed for {device_id}",
+            "filename": filename,
+            "backup_id": backup_id,
+            "download_url": f"/api/backups/{backup_id}"
+        }
+        # Large configs can be left out and streamed from download_url instead
+        if include_config:
+            response["config"] = running_config
+        
+        return jsonify(response)
+    
+    except DeviceUnreachableError as e:
+        audit_event("backup", device_id, "show running-config", "unreachable", get_request_user(), error=str(e))
+        return jsonify({"error": str(e), "state": "unreachable"}), 503
     
     except Exception as e:
-        print(f"Error backing up configuration: {e}")
+        log_error("backup_config", f"Error backing up configuration: {e}", device_id)
+        audit_event("backup", device_id, "show running-config", "error", get_request_user(), error=str(e))
         return jsonify({"error": f"Failed to backup configuration: {str(e)}"}), 500
 
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """Endpoint to list stored configuration backups"""
+    device_id = request.args.get('device_id')
+    
+    if device_id and device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    return jsonify({"backups": list_backups(device_id)})
+
+@app.route('/api/backups/<backup_id>', methods=['GET'])
+def download_backup(backup_id):
+    """Endpoint to stream a stored backup, compressed when accepted and resumable with Range"""
+    path = get_backup_path(backup_id)
+    if path is None:
+        return jsonify({"error": f"Backup {backup_id} not found"}), 404
+    
+    encoding = choose_transfer_encoding(request.accept_encodings)
+    if encoding != "identity":
+        path = get_compressed_backup(path, encoding)
+    
+    # send_file resolves relative paths against the app package, not the working directory
+    response = send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True, download_name=f"{backup_id}.cfg", conditional=True, etag=True)
+    if encoding != "identity":
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    
+    audit_event("backup_download", backup_device(backup_id), user=get_request_user(), backup_id=backup_id, encoding=encoding, range=request.headers.get('Range'))
+    return response
+
+@app.route('/api/uploads', methods=['POST'])
+def start_config_upload():
+    """Endpoint to start a streaming configuration upload"""
+    data = request.json
+    device_id = data.get('device_id')
+    encoding = data.get('encoding', 'identity')
+    total = data.get('size')
+    encodings = ['identity', 'gzip'] + (['zstd'] if backend_available("zstandard") else [])
+    
+    if not device_id:
+        return jsonify({"error": "Device ID is required"}), 400
+    
+    if encoding not in encodings:
+        return jsonify({"error": f"Encoding must be one of: {', '.join(encodings)}"}), 400
+    
+    if total is not None and (not isinstance(total, int) or total < 0):
+        return jsonify({"error": "Size must be a non-negative number of bytes"}), 400
+    
+    if total is not None and total > CONFIG_UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"Uploads are limited to {CONFIG_UPLOAD_MAX_BYTES} bytes"}), 413
+    
+    if device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    upload_id = create_config_upload(device_id, encoding, total)
+    return jsonify({"upload_id": upload_id, "offset": 0, "upload_url": f"/api/uploads/{upload_id}"}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """Endpoint to get the number of bytes received so far, to resume an upload"""
+    upload = get_config_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": f"Upload {upload_id} not found"}), 404
+    
+    return jsonify({"upload_id": upload_id, "device": upload["device"], "offset": upload["offset"], "total": upload["total"]})
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_config_upload(upload_id):
+    """Endpoint to stream (part of) a configuration; stores it as a backup once complete"""
+    upload = get_config_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": f"Upload {upload_id} not found"}), 404
+    
+    # Without Content-Range the body is the rest of the upload
+    content_range = request.headers.get('Content-Range')
+    start = upload["offset"]
+    if content_range:
+        match = CONTENT_RANGE_PATTERN.match(content_range.strip())
+        if not match:
+            return jsonify({"error": "Content-Range must look like 'bytes start-end/total'"}), 400
+        start = int(match.group(1))
+        if match.group(3) != '*':
+            upload["total"] = int(match.group(3))
+    
+    if start != upload["offset"]:
+        return jsonify({"error": f"Upload is at offset {upload['offset']}", "offset": upload["offset"]}), 409
+    
+    try:
+        offset = append_config_upload(upload, request.stream, start)
+    except ValueError as e:
+        return jsonify({"error": str(e), "offset": upload["offset"]}), 413
+    
+    if content_range and (upload["total"] is None or offset < upload["total"]):
+        return jsonify({"upload_id": upload_id, "offset": offset, "total": upload["total"]}), 202
+    
+    try:
+        backup_id = finish_config_upload(upload_id)
+    except ConfigTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        log_error("config_upload", f"Error storing uploaded configuration: {e}", upload["device"])
+        return jsonify({"error": f"Failed to decode uploaded configuration: {str(e)}"}), 400
+    
+    audit_event("backup_upload", upload["device"], user=get_request_user(), backup_id=backup_id, encoding=upload["encoding"], bytes=offset)
+    
+    return jsonify({
+        "message": f"Configuration stored for {upload['device']}",
+        "backup_id": backup_id,
+        "download_url": f"/api/backups/{backup_id}"
+    }), 201
+
+@app.route('/api/config_search', methods=['GET'])
+def config_search():
+    """Endpoint to search the latest configuration backups of all devices"""
+    query = request.args.get('q', '').strip()
+    device_id = request.args.get('device_id')
+    
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "Limit must be a positive integer"}), 400
+    
+    started = time.perf_counter()
+    with track_stage("config_search"):
+        sync_config_index()
+        matches = search_configs(query, device_id, limit)
+    
+    return jsonify({
+        "query": query,
+        "devices": sorted({match["device"] for match in matches}),
+        "matches": matches,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
 @app.route('/api/restore', methods=['POST'])
 def restore_config():
     """Endpoint to restore device configurations"""
     data = request.json
     device_id = data.get('device_id')
     config = data.get('config')
+    backup_id = data.get('backup_id')
+    allow_other_device = data.get('allow_other_device', False) is True
+    priority = get_request_priority(data, "interactive")
     
-    if not device_id or not config:
-        return jsonify({"error": "Device ID and configuration are required"}), 400
+    if not device_id or not (config or backup_id):
+        return jsonify({"error": "Device ID and a configuration or backup ID are required"}), 400
+    
+    if priority is None:
+        return jsonify({"error": f"Priority must be one of: {', '.join(SCHEDULER_PRIORITIES)}"}), 400
     
     if device_id not in NETWORK_DEVICES:
         return jsonify({"error": f"Device {device_id} not found"}), 404
     
-    device = NETWORK_DEVICES[device_id]
+    # A stored backup is passed to NAPALM by file name instead of being loaded here
+    backup_path = None
+    if backup_id:
+        backup_path = get_backup_path(backup_id)
+        if backup_path is None:
+            return jsonify({"error": f"Backup {backup_id} not found"}), 404
+        # Pushing another device's config is almost always a mistake, so it must be asked for
+        if backup_device(backup_id) != device_id and not allow_other_device:
+            return jsonify({"error": f"Backup {backup_id} belongs to {backup_device(backup_id)}, not {device_id}; set allow_other_device to restore it anyway"}), 400
+    
+    # Record the config push before touching the device
+    user = get_request_user()
+    if backup_path:
+        config_lines, config_hash = describe_config_file(backup_path)
+    else:
+        config_lines, config_hash = config.count('\n') + 1, hashlib.sha256(config.encode('utf-8', errors='replace')).hexdigest()
+    restore_details = {"lines": config_lines, "sha256": config_hash, "backup_id": backup_id}
+    if backup_id and backup_device(backup_id) != device_id:
+        restore_details["backup_device"] = backup_device(backup_id)
+    audit_event("restore", device_id, "load_merge_candidate", "started", user, **restore_details)
     
     # If we're in simulation mode, return a simulated response
-    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not NAPALM_AVAILABLE:
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("napalm"):
+        audit_event("restore", device_id, "load_merge_candidate", user=user, simulated=True, **restore_details)
         return jsonify({
             "message": f"Configuration restored successfully for {device_id}",
             "device": device_id
         })
     
-    try:
+    def merge_config():
         # Use NAPALM to restore the configuration
-        driver = get_network_driver(device['device_type'].replace('_', ''))
-        with driver(
-            hostname=device['ip'],
-            username=device['username'],
-            password=device['password'],
-            optional_args={'secret': device['secret'] if device['secret'] else ''}
-        ) as device_conn:
+        with device_circuit(device_id), napalm_session(device_id) as device_conn:
             # Load the configuration
-            device_conn.load_merge_candidate(config=config)
+            if backup_path:
+                device_conn.load_merge_candidate(filename=backup_path)
+            else:
+                device_conn.load_merge_candidate(config=config)
             
             # Check for differences
             diff = device_conn.compare_config()
             
             if not diff:
                 device_conn.discard_config()
-                return jsonify({
-                    "message": "No configuration changes needed",
-                    "device": device_id
-                })
+                return None
             
             # Commit the changes
             device_conn.commit_config()
-            
+            return diff
+    
+    try:
+        diff = run_device_task(device_id, priority, merge_config)
+        
+        if not diff:
+            audit_event("restore", device_id, "load_merge_candidate", "unchanged", user, **restore_details)
             return jsonify({
-                "message": f"Configuration restored successfully for {device_id}",
-                "device": device_id,
-                "diff": diff
+                "message": "No configuration changes needed",
+                "device": device_id
             })
+        
+        audit_event("restore", device_id, "load_merge_candidate", user=user, diff=diff, **restore_details)
+        
+        return jsonify({
+            "message": f"Configuration restored successfully for {device_id}",
+            "device": device_id,
+            "diff": diff
+        })
+    
+    except DeviceUnreachableError as e:
+        audit_event("restore", device_id, "load_merge_candidate", "unreachable", user, error=str(e), **restore_details)
+        return jsonify({"error": str(e), "state": "unreachable"}), 503
     
     except Exception as e:
-        print(f"Error restoring configuration: {e}")
+        log_error("restore_config", f"Error restoring configuration: {e}", device_id)
+        audit_event("restore", device_id, "load_merge_candidate", "error", user, error=str(e), **restore_details)
         return jsonify({"error": f"Failed to restore configuration: {str(e)}"}), 500
 
 @app.route('/api/test', methods=['POST'])
@@ -784,9 +4004,10 @@ def test_device():
         return jsonify({"error": f"Device {device_id} not found"}), 404
     
     device = NETWORK_DEVICES[device_id]
+    audit_event("test", device_id, test_type, user=get_request_user())
     
     # If we're in simulation mode or pyATS is not available, return simulated results
-    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not PYATS_AVAILABLE:
+    if os.getenv("SIMULATION_MODE", "true").lower() == "true" or not backend_available("pyats"):
         test_results = {
             "device": device_id,
             "test_type": test_type,
@@ -824,30 +4045,32 @@ def test_device():
             json.dump(testbed, f)
         
         # Load the testbed
-        tb = loader.load('testbed.yaml')
+        tb = get_backend("pyats")['loader'].load('testbed.yaml')
         dev = tb.devices[device_id]
         
         # Connect to the device
-        dev.connect()
+        with track_stage("pyats_connect", device=device_id):
+            dev.connect()
         
         # Run tests based on test_type
         results = {}
-        if test_type == 'connectivity':
-            # Test basic connectivity
-            results['ping'] = dev.ping('8.8.8.8')
-            results['traceroute'] = dev.traceroute('8.8.8.8')
-        elif test_type == 'interfaces':
-            # Test interfaces
-            parser = dev.parse('show interfaces')
-            results['interfaces'] = parser
-        elif test_type == 'routing':
-            # Test routing
-            parser = dev.parse('show ip route')
-            results['routes'] = parser
-        else:
-            # Default to basic device info
-            parser = dev.parse('show version')
-            results['version'] = parser
+        with track_stage("pyats_test", device=device_id, test_type=test_type):
+            if test_type == 'connectivity':
+                # Test basic connectivity
+                results['ping'] = dev.ping('8.8.8.8')
+                results['traceroute'] = dev.traceroute('8.8.8.8')
+            elif test_type == 'interfaces':
+                # Test interfaces
+                parser = dev.parse('show interfaces')
+                results['interfaces'] = parser
+            elif test_type == 'routing':
+                # Test routing
+                parser = dev.parse('show ip route')
+                results['routes'] = parser
+            else:
+                # Default to basic device info
+                parser = dev.parse('show version')
+                results['version'] = parser
         
         # Disconnect from the device
         dev.disconnect()
@@ -861,7 +4084,7 @@ def test_device():
         })
     
     except Exception as e:
-        print(f"Error testing device: {e}")
+        log_error("test_device", f"Error testing device: {e}", device_id)
         return jsonify({
             "device": device_id,
             "test_type": test_type,
@@ -873,9 +4096,54 @@ def test_device():
 @app.route('/api/analyze_network_anomalies', methods=['GET'])
 def api_analyze_network_anomalies():
     """Endpoint to analyze network anomalies"""
-    anomalies = analyze_network_anomalies(NETWORK_DEVICES)
+    with track_stage("analyze_network_anomalies"):
+        anomalies = analyze_network_anomalies(NETWORK_DEVICES)
+    
+    # Optionally include compliance findings from the latest backups
+    if request.args.get('compliance', 'false').lower() == 'true':
+        try:
+            findings, _ = run_compliance_checks()
+            anomalies = anomalies + findings
+        except ValueError as e:
+            log_error("compliance", f"Error loading compliance rules: {e}")
+    
     return jsonify({"anomalies": anomalies})
 
+@app.route('/api/compliance', methods=['GET'])
+def get_compliance():
+    """Endpoint to check device configurations against the compliance rules"""
+    source = request.args.get('source', 'backup')
+    device_id = request.args.get('device_id')
+    severity = request.args.get('severity')
+    
+    if source not in ('backup', 'live'):
+        return jsonify({"error": "Source must be backup or live"}), 400
+    
+    if severity and severity not in COMPLIANCE_SEVERITIES:
+        return jsonify({"error": f"Severity must be one of: {', '.join(COMPLIANCE_SEVERITIES)}"}), 400
+    
+    if device_id and device_id not in NETWORK_DEVICES:
+        return jsonify({"error": f"Device {device_id} not found"}), 404
+    
+    started = time.perf_counter()
+    try:
+        findings, devices = run_compliance_checks([device_id] if device_id else None, source)
+    except ValueError as e:
+        log_error("compliance", f"Error loading compliance rules: {e}")
+        return jsonify({"error": f"Failed to load compliance rules: {str(e)}"}), 500
+    
+    if severity:
+        findings = [finding for finding in findings if finding["severity"] == severity]
+    
+    return jsonify({
+        "source": source,
+        "findings": findings,
+        "devices": devices,
+        "rules": len(COMPLIANCE_STATE["rules"]),
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
 @app.route('/api/device_metrics', methods=['GET'])
 def get_device_metrics():
     """Endpoint to get device metrics for monitoring"""
@@ -906,12 +4174,83 @@ def close_connections():
             try:
                 conn_info['connection'].disconnect()
             except Exception as e:
-                print(f"Error disconnecting from {device_id}: {e}")
+                log_error("close_connections", f"Error disconnecting from {device_id}: {e}", device_id)
     
     DEVICE_CONNECTIONS = {}
+    close_async_ssh_sessions()
     
     return jsonify({"message": "All connections closed"})
 
+def parse_audit_time(value):
+    """Parse an epoch or ISO 8601 timestamp from a query argument"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/audit', methods=['GET'])
+def get_audit_log():
+    """Endpoint to query the audit journal by device, user, time range, action and command"""
+    try:
+        since = parse_audit_time(request.args.get('since'))
+        until = parse_audit_time(request.args.get('until'))
+    except ValueError:
+        return jsonify({"error": "since and until must be epoch seconds or ISO 8601 timestamps"}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "Limit must be a positive integer"}), 400
+    
+    entries = query_audit_log(
+        device=request.args.get('device'),
+        user=request.args.get('user'),
+        since=since,
+        until=until,
+        command=request.args.get('command'),
+        action=request.args.get('action'),
+        limit=limit
+    )
+    
+    return jsonify({"entries": entries, "count": len(entries)})
+
+@app.route('/api/scheduler', methods=['GET'])
+def scheduler_status():
+    """Endpoint to show device scheduler limits, running tasks and queue depths"""
+    return jsonify(get_scheduler_status())
+
+@app.route('/api/circuit_breakers', methods=['GET'])
+def circuit_breakers():
+    """Endpoint to show circuit breaker state for devices and discovered hosts"""
+    breakers = get_circuit_breakers()
+    state = request.args.get('state')
+    if state:
+        breakers = {key: breaker for key, breaker in breakers.items() if breaker["state"] == state}
+    return jsonify({"breakers": breakers})
+
+@app.route('/api/circuit_breakers/<key>/reset', methods=['POST'])
+def reset_circuit_breaker_endpoint(key):
+    """Endpoint to close a circuit breaker by hand"""
+    if not reset_circuit_breaker(key):
+        return jsonify({"error": f"No circuit breaker for {key}"}), 404
+    
+    audit_event("circuit_reset", key if key in NETWORK_DEVICES else None, user=get_request_user(), key=key)
+    return jsonify({"message": f"Circuit breaker for {key} closed", "breaker": get_circuit_breakers()[key]})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Endpoint exposing latency histograms and counters in the Prometheus text format"""
+    return render_prometheus_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/startup_report', methods=['GET'])
+def startup_report():
+    """Endpoint to report startup time and import cost of network backends"""
+    return jsonify(get_startup_report())
+
 # Cleanup connections when the application exits
 import atexit
 
@@ -924,6 +4263,17 @@ def cleanup_connections():
                 conn_info['connection'].disconnect()
             except Exception:
                 pass
+    close_async_ssh_sessions()
+
+atexit.register(close_audit_log)
+
+# Optionally import backends up front (e.g. PRELOAD_BACKENDS=netmiko,napalm) so a
+# pre-forking server pays the cost once in the master instead of on first request
+for backend_name in os.getenv("PRELOAD_BACKENDS", "").split(","):
+    if backend_name.strip() in NETWORK_BACKENDS:
+        get_backend(backend_name.strip())
+
+MODULE_LOAD_SECONDS = time.perf_counter() - MODULE_LOAD_STARTED
 
 if __name__ == '__main__':
     # Create necessary directories
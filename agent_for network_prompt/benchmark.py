@@ -0,0 +1,353 @@
+"""
+Load and latency benchmark for the Network Management Assistant.
+
+Drives the Flask app over HTTP against a local fake OpenAI endpoint and
+simulated Netmiko/NAPALM devices with configurable latency, sweeping
+concurrency and inventory size. Results are saved as JSON so runs can be
+compared to spot regressions.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --inventory 4,100,1000,10000 --concurrency 1,8,32
+    python benchmark.py --compare bench_results/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from werkzeug.serving import make_server
+
+# app.py loads the agent prompt relative to the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(BASE_DIR)
+
+import app as network_app
+import openai
+
+# Backups, audit logs and the translation index are written relative to the
+# working directory, so the run happens in a scratch directory instead
+WORK_DIR = tempfile.mkdtemp(prefix="network_benchmark_")
+os.chdir(WORK_DIR)
+network_app.AUDIT_LOG_DIR = os.path.join(WORK_DIR, "audit")
+network_app.TRANSLATION_INDEX_PATH = os.path.join(WORK_DIR, "translations.jsonl")
+network_app.COMPLIANCE_RULES_PATH = os.path.join(BASE_DIR, "compliance_rules.json")
+
+# Demo inventory from app.py, used as templates for synthetic devices
+ORIGINAL_DEVICES = dict(network_app.NETWORK_DEVICES)
+
+# Request payloads per endpoint: (method, path, body). /api/discover only starts
+# a background thread, so the discover scenario calls the discovery function
+# directly with the body as keyword arguments.
+ENDPOINTS = {
+    "execute": ("POST", "/api/execute", {"query": "show interfaces on router1"}),
+    "device_metrics": ("GET", "/api/device_metrics", None),
+    "discover": ("CALL", "discover_network_devices", {"subnet": "10.255.255.0/30"}),
+    "devices": ("GET", "/api/devices", None),
+    "backup": ("POST", "/api/backup", {"device_id": "router1"})
+}
+
+# Latency settings shared with the fake OpenAI server and fake devices
+LATENCY = {"openai": 0.05, "connect": 0.2, "command": 0.02, "jitter": 0.2}
+
+def sleep_with_jitter(seconds):
+    """Sleep for the given latency plus or minus the configured jitter fraction"""
+    if seconds > 0:
+        time.sleep(seconds * random.uniform(1 - LATENCY["jitter"], 1 + LATENCY["jitter"]))
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers /chat/completions with canned content after a configurable delay"""
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        system_prompt = body.get("messages", [{}])[0].get("content", "")
+        sleep_with_jitter(LATENCY["openai"])
+        
+        if "device identifier" in system_prompt:
+            content = "router1"
+        elif "command translator" in system_prompt:
+            content = "show interfaces"
+        elif "anomaly detection" in system_prompt:
+            content = "[]"
+        elif "Suggest 5" in system_prompt:
+            content = json.dumps([{"command": "show version", "description": "Display version"}])
+        else:
+            content = "GigabitEthernet0/0 is up, line protocol is up"
+        
+        payload = json.dumps({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }).encode()
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+class FakeNetmikoConnection:
+    """Stands in for a Netmiko ConnectHandler session"""
+    
+    def __init__(self, **params):
+        sleep_with_jitter(LATENCY["connect"])
+        self.host = params.get('ip')
+    
+    def send_command(self, command, **kwargs):
+        sleep_with_jitter(LATENCY["command"])
+        return f"{self.host}# {command}\nGigabitEthernet0/0 is up, line protocol is up"
+    
+    def send_config_set(self, commands, **kwargs):
+        sleep_with_jitter(LATENCY["command"] * len(commands))
+        return "\n".join(f"{self.host}(config)# {line}" for line in commands)
+    
+    def disconnect(self):
+        pass
+
+class FakeNapalmDevice:
+    """Stands in for a NAPALM network driver instance"""
+    
+    def __init__(self, hostname, username=None, password=None, timeout=60, optional_args=None):
+        self.hostname = hostname
+    
+    def open(self):
+        sleep_with_jitter(LATENCY["connect"])
+    
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        self.open()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+    
+    def get_facts(self):
+        sleep_with_jitter(LATENCY["command"])
+        return {"hostname": f"host-{self.hostname}", "vendor": "Cisco", "model": "ISR4431", "os_version": "17.3.3"}
+    
+    def get_config(self, retrieve='all'):
+        sleep_with_jitter(LATENCY["command"])
+        return {"running": f"hostname host-{self.hostname}\n!\ninterface GigabitEthernet0/0\n ip address {self.hostname} 255.255.255.0\n!\n", "startup": "", "candidate": ""}
+    
+    def get_interfaces(self):
+        sleep_with_jitter(LATENCY["command"])
+        return {"GigabitEthernet0/0": {"is_up": True, "is_enabled": True, "speed": 1000}}
+    
+    def cli(self, commands):
+        sleep_with_jitter(LATENCY["command"] * len(commands))
+        return {command: f"{self.hostname}# {command}" for command in commands}
+    
+    def load_merge_candidate(self, config=None, filename=None):
+        pass
+    
+    def compare_config(self):
+        return ""
+    
+    def commit_config(self):
+        pass
+    
+    def discard_config(self):
+        pass
+
+def install_fake_backends():
+    """Point the app's backend registry at the simulated Netmiko and NAPALM devices"""
+    network_app.LOADED_BACKENDS["netmiko"] = {"symbols": {"ConnectHandler": FakeNetmikoConnection}, "import_seconds": 0.0}
+    network_app.LOADED_BACKENDS["napalm"] = {"symbols": {"get_network_driver": lambda name: FakeNapalmDevice}, "import_seconds": 0.0}
+    # Discovery falls back to NAPALM when Nornir is unavailable
+    network_app.LOADED_BACKENDS["nornir"] = {"symbols": None, "import_seconds": 0.0}
+
+def build_inventory(size):
+    """Reset NETWORK_DEVICES to the demo devices plus synthetic ones up to the requested size"""
+    base = {device_id: device for device_id, device in ORIGINAL_DEVICES.items()}
+    templates = list(base.values())
+    for i in range(len(base), size):
+        template = templates[i % len(templates)]
+        device = dict(template)
+        device["ip"] = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        base[f"device_{i + 1}"] = device
+    network_app.NETWORK_DEVICES.clear()
+    network_app.NETWORK_DEVICES.update(dict(list(base.items())[:size]))
+    network_app.DEVICE_CONNECTIONS.clear()
+
+def send_request(base_url, endpoint):
+    """Send one request to an endpoint and return (latency_seconds, ok)"""
+    method, path, body = ENDPOINTS[endpoint]
+    if method == "CALL":
+        started = time.perf_counter()
+        try:
+            getattr(network_app, path)(**body)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+    
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            response.read()
+            ok = response.status < 400
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def run_scenario(base_url, endpoint, concurrency, total_requests):
+    """Fire total_requests at an endpoint with the given concurrency and summarize latencies"""
+    # Warm caches and connections so the first request doesn't skew the tail
+    send_request(base_url, endpoint)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: send_request(base_url, endpoint), range(total_requests)))
+    elapsed = time.perf_counter() - started
+    
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2),
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2)
+    }
+
+def git_revision():
+    """Return the current git commit, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare_results(current, baseline_path):
+    """Print p95 and throughput changes against a previous results file"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    
+    previous = {(r["endpoint"], r["inventory"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nComparison against {baseline_path} ({baseline['meta'].get('git_revision')}):")
+    print(f"{'endpoint':<16}{'inventory':>10}{'conc':>6}{'p95 ms':>12}{'delta':>9}{'rps':>10}{'delta':>9}")
+    for r in current["results"]:
+        old = previous.get((r["endpoint"], r["inventory"], r["concurrency"]))
+        if not old:
+            continue
+        p95_delta = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        rps_delta = (r["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100 if old["throughput_rps"] else 0.0
+        print(f"{r['endpoint']:<16}{r['inventory']:>10}{r['concurrency']:>6}{r['p95_ms']:>12}{p95_delta:>+8.1f}%{r['throughput_rps']:>10}{rps_delta:>+8.1f}%")
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Network Management Assistant API")
+    parser.add_argument('--endpoints', default='execute,device_metrics,discover', help="Comma separated endpoints: " + ", ".join(ENDPOINTS))
+    parser.add_argument('--concurrency', type=parse_int_list, default=[1, 8, 32])
+    parser.add_argument('--inventory', type=parse_int_list, default=[4, 100, 1000, 10000])
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint per scenario")
+    parser.add_argument('--openai-latency', type=float, default=LATENCY["openai"], help="Seconds per fake OpenAI call")
+    parser.add_argument('--connect-latency', type=float, default=LATENCY["connect"], help="Seconds to open a fake device session")
+    parser.add_argument('--command-latency', type=float, default=LATENCY["command"], help="Seconds per fake device command")
+    parser.add_argument('--jitter', type=float, default=LATENCY["jitter"], help="Random latency variation as a fraction")
+    parser.add_argument('--simulation-mode', action='store_true', help="Benchmark SIMULATION_MODE instead of the fake device backends")
+    parser.add_argument('--output', default=None, help="Results file (default: bench_results/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Previous results file to compare against")
+    args = parser.parse_args()
+    
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"Unknown endpoint {endpoint}")
+    
+    LATENCY.update({"openai": args.openai_latency, "connect": args.connect_latency, "command": args.command_latency, "jitter": args.jitter})
+    
+    # Fake OpenAI endpoint
+    openai_server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    openai_server.daemon_threads = True
+    threading.Thread(target=openai_server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{openai_server.server_port}/v1"
+    openai.api_key = "benchmark"
+    
+    os.environ["SIMULATION_MODE"] = "true" if args.simulation_mode else "false"
+    if not args.simulation_mode:
+        install_fake_backends()
+    
+    # Flask app behind a real threaded HTTP server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app_server = make_server('127.0.0.1', 0, network_app.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{app_server.server_port}"
+    
+    results = []
+    print(f"{'endpoint':<16}{'inventory':>10}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for inventory in args.inventory:
+        for endpoint in endpoints:
+            # Discovery adds devices, so every endpoint starts from the same inventory
+            build_inventory(inventory)
+            for concurrency in args.concurrency:
+                summary = run_scenario(base_url, endpoint, concurrency, args.requests)
+                summary.update({"endpoint": endpoint, "inventory": inventory, "concurrency": concurrency})
+                results.append(summary)
+                print(f"{endpoint:<16}{inventory:>10}{concurrency:>6}{summary['throughput_rps']:>10}{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['errors']:>8}")
+    
+    app_server.shutdown()
+    openai_server.shutdown()
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "simulation_mode": args.simulation_mode,
+            "requests_per_scenario": args.requests,
+            "latency": dict(LATENCY)
+        },
+        "results": results
+    }
+    
+    output = os.path.join(BASE_DIR, args.output or os.path.join("bench_results", datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+    
+    if args.compare:
+        compare_results(report, os.path.join(BASE_DIR, args.compare))
+    
+    network_app.close_audit_log()
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file